@@ -1,5 +1,12 @@
-from .api import download, download_coro
+from .api import download, download_coro, download_many, stream
+from .stream import write_to
 from .core import Core
+from .scheduler import Scheduler, JobResult
+from .retry import RetryPolicy
+from .observer import Observer, MetricsCollector, JobSummary
+from .ratelimit import TokenBucket
+from .cache import SegmentCache
+from .selection import VariantPolicy, VariantProbe, HighestBandwidth, TargetResolution, FastestToComplete
 
 
 __title__ = "aiom3u8"
@@ -14,5 +21,21 @@ __copyright__ = "Copyright 2022 yfd"
 __all__ = (
     "download",
     "download_coro",
-    "Core"
+    "download_many",
+    "stream",
+    "write_to",
+    "Core",
+    "Scheduler",
+    "JobResult",
+    "RetryPolicy",
+    "Observer",
+    "MetricsCollector",
+    "JobSummary",
+    "TokenBucket",
+    "SegmentCache",
+    "VariantPolicy",
+    "VariantProbe",
+    "HighestBandwidth",
+    "TargetResolution",
+    "FastestToComplete"
 )
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from collections import deque
+from typing import Optional
+
+from .params_def import (
+    ADAPTIVE_INITIAL_WINDOW,
+    ADAPTIVE_LATENCY_SAMPLES,
+    ADAPTIVE_LATENCY_INFLATION,
+    ADAPTIVE_THROUGHPUT_TOLERANCE,
+    ADAPTIVE_DECREASE_FACTOR,
+    ADAPTIVE_BACKOFF_FACTOR
+)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller of the number of in-flight slice requests
+    the window grows by one per round while the aggregate throughput keeps up and latency stays near its baseline,
+    it is cut multiplicatively on queueing latency, and halved on server pushback (429/503, connection resets),
+    during `Retry-After` no new request is let through at all
+    """
+
+    __slots__ = (
+        "_window",
+        "_max_window",
+        "_in_flight",
+        "_waiters",
+        "_paused_until",
+        "_latencies",
+        "_base_latency",
+        "_round_bytes",
+        "_round_done",
+        "_round_start",
+        "_last_throughput",
+        "_last_decrease"
+    )
+
+    def __init__(self, max_window: int, initial_window: int = ADAPTIVE_INITIAL_WINDOW) -> None:
+        self._max_window = max(max_window, 1)
+        self._window = float(min(initial_window, self._max_window))
+        self._in_flight = 0
+        self._waiters = deque()
+        self._paused_until = 0.
+
+        self._latencies = deque(maxlen=ADAPTIVE_LATENCY_SAMPLES)
+        self._base_latency = None
+        self._round_bytes = 0
+        self._round_done = 0
+        self._round_start = None
+        self._last_throughput = 0.
+        self._last_decrease = 0.
+
+    @property
+    def window(self) -> int:
+        """ current number of requests allowed in flight """
+
+        return int(self._window)
+
+    @property
+    def max_window(self) -> int:
+        return self._max_window
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if (delay := self._paused_until - loop.time()) > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            if self._in_flight < self.window:
+                self._in_flight += 1
+
+                if self._round_start is None:
+                    self._round_start = loop.time()
+
+                return
+
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._wake_up()
+
+    def on_success(self, latency: float, size: int) -> None:
+        """ a slice is done, `latency` is the time to its response headers """
+
+        self._latencies.append(latency)
+        self._round_bytes += size
+        self._round_done += 1
+
+        if self._round_done < self.window:
+            return
+
+        # a full window of requests has completed, time to adjust
+        loop = asyncio.get_running_loop()
+        throughput = self._round_bytes / max(loop.time() - self._round_start, 1e-6)
+
+        latencies = sorted(self._latencies)
+        p50 = latencies[len(latencies) // 2]
+        p90 = latencies[int(len(latencies) * 0.9)]
+        self._base_latency = p50 if self._base_latency is None else min(self._base_latency, p50)
+
+        if p90 > self._base_latency * ADAPTIVE_LATENCY_INFLATION and throughput <= self._last_throughput:
+            # requests are queueing up somewhere without gaining anything
+            self._decrease(ADAPTIVE_DECREASE_FACTOR)
+        elif throughput >= self._last_throughput * ADAPTIVE_THROUGHPUT_TOLERANCE:
+            self._window = min(self._window + 1, self._max_window)
+            self._wake_up()
+
+        self._last_throughput = throughput
+        self._round_bytes = 0
+        self._round_done = 0
+        self._round_start = loop.time()
+
+    def on_pushback(self, retry_after: Optional[float] = None) -> None:
+        """ the server refused (429/503) or dropped the request """
+
+        if retry_after:
+            self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + retry_after)
+
+        self._decrease(ADAPTIVE_BACKOFF_FACTOR)
+
+    def _decrease(self, factor: float) -> None:
+        loop = asyncio.get_running_loop()
+
+        # requests in flight together tend to fail together, count them as one signal
+        if loop.time() - self._last_decrease < (self._base_latency or 0):
+            return
+
+        self._last_decrease = loop.time()
+        self._window = max(self._window * factor, 1.)
+
+    def _wake_up(self) -> None:
+        free = self.window - self._in_flight
+
+        for waiter in self._waiters:
+            if free <= 0:
+                break
+
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
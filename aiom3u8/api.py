@@ -1,7 +1,16 @@
+import os
 import asyncio
 
-from typing import Coroutine
+from typing import (
+    AsyncIterator,
+    Coroutine,
+    Iterable,
+    Mapping,
+    List
+)
 from .core import Core
+from .scheduler import Scheduler, JobResult
+from .params_def import STREAM_READ_AHEAD
 
 
 def download(m3u8, video_path, video_name, **kwargs) -> None:
@@ -17,3 +26,22 @@ def download_coro(m3u8, video_path, video_name, **kwargs) -> Coroutine:
     """ get a download coroutine """
 
     return Core(m3u8, video_path, video_name, **kwargs).download()
+
+
+def stream(m3u8, read_ahead: int = STREAM_READ_AHEAD, **kwargs) -> AsyncIterator[bytes]:
+    """
+    get an async iterator of the decrypted slices in playlist order, nothing is written to disk,
+    see `aiom3u8.write_to` for piping it into a sink
+    """
+
+    # no video is written, the current directory only stands in for the required path
+    return Core(m3u8, os.curdir, "stream", **kwargs).iter_segments(read_ahead)
+
+
+def download_many(jobs: Iterable[Mapping], **kwargs) -> List[JobResult]:
+    """
+    download many videos at once under a global in-flight limit, see `Scheduler` for the arguments
+    failures are reported per job instead of being raised
+    """
+
+    return asyncio.run(Scheduler(**kwargs).run(jobs))
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+import hashlib
+import threading
+
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from typing import (
+    Optional,
+    Tuple
+)
+
+from .params_def import (
+    CACHE_MAX_SIZE,
+    CACHE_EVICT_RATIO,
+    CACHE_FILE_SUFFIX,
+    MERGE_BUFFER_SIZE
+)
+
+
+class SegmentCache:
+    """
+    local cache of the decrypted slices, keyed by the normalized url, the byte range and the key of a slice,
+    shared by the jobs and the runs pointing to the same directory, the least recently used slices are evicted
+    once the cache grows over `max_size` bytes
+    entries are written to a temporary file and renamed into place, so that concurrent jobs, or processes,
+    never see a partial one; the methods block, and are run in an executor by `Core`
+    """
+
+    __slots__ = (
+        "_directory",
+        "_max_size",
+        "_ignore_query",
+        "_size",
+        "_lock"
+    )
+
+    def __init__(self, directory: str, max_size: int = CACHE_MAX_SIZE, ignore_query: bool = False) -> None:
+        if max_size <= 0:
+            raise ValueError("`max_size` must be positive")
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._directory = directory
+        self._max_size = max_size
+        # signed urls carry a different token on every run, while the query may as well tell the slices apart
+        self._ignore_query = ignore_query
+        # bytes in the cache as far as this process knows, worked out again from the directory on eviction
+        self._size = None
+        self._lock = threading.Lock()
+
+    def key(
+        self, url: str, byterange: Optional[Tuple[int, int]] = None, key: Optional[bytes] = None,
+        iv: Optional[bytes] = None
+    ) -> str:
+        parts = [self._normalize(url)]
+
+        if byterange:
+            parts.append("%d@%d" % byterange)
+
+        if key:
+            # the slice is cached decrypted, so the same bytes under another key are another slice
+            parts.append(hashlib.sha256(key + (iv or b'')).hexdigest())
+
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    def get(self, key: str, path: Optional[str]) -> Optional[Tuple[int, int, Optional[bytes]]]:
+        """
+        copy the cached slice to `path`, or read it into memory without a path,
+        return its size, crc32 and the slice itself if read into memory, `None` on a miss
+        """
+
+        cached_path = self._path(key)
+
+        try:
+            with open(cached_path, 'rb') as cached_file:
+                if path is None:
+                    data = cached_file.read()
+                    size, checksum = len(data), zlib.crc32(data)
+                else:
+                    data = None
+                    size, checksum = _copy(cached_file, path)
+
+            # recently used
+            os.utime(cached_path)
+        except FileNotFoundError:
+            return None
+
+        return size, checksum, data
+
+    def put(self, key: str, path: Optional[str], data: Optional[bytes] = None) -> None:
+        """ cache the slice at `path`, or `data` without a path """
+
+        cached_path = self._path(key)
+        temp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}"
+
+        try:
+            with open(temp_path, 'wb') as temp_file:
+                if path is None:
+                    temp_file.write(data)
+                    size = len(data)
+                else:
+                    with open(path, 'rb') as slice_file:
+                        size, _ = _copy(slice_file, temp_file)
+
+            os.replace(temp_path, cached_path)
+        except OSError:
+            # the cache is an optimization only, a slice which can not be cached is fetched next time again
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+
+            if self._size > self._max_size:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries():
+                _remove(entry.path)
+
+            self._size = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key + CACHE_FILE_SUFFIX)
+
+    def _normalize(self, url: str) -> str:
+        parts = urlsplit(url)
+        netloc = parts.netloc.lower()
+
+        for scheme, port in (("http", ":80"), ("https", ":443")):
+            if parts.scheme.lower() == scheme and netloc.endswith(port):
+                netloc = netloc[: -len(port)]
+
+        query = '' if self._ignore_query else urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+        return f"{parts.scheme.lower()}://{netloc}{parts.path or '/'}" + (f"?{query}" if query else '')
+
+    def _entries(self) -> list:
+        with os.scandir(self._directory) as entries:
+            return [entry for entry in entries if entry.name.endswith(CACHE_FILE_SUFFIX) and entry.is_file()]
+
+    def _scan_size(self) -> int:
+        size = 0
+
+        for entry in self._entries():
+            try:
+                size += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+
+        return size
+
+    def _evict(self) -> None:
+        """ drop the least recently used slices, down to a bit below `max_size` so that it is not done on every put """
+
+        stats = []
+
+        for entry in self._entries():
+            try:
+                stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                # evicted by another process in the meantime
+                pass
+
+        self._size = sum(size for _, size, _ in stats)
+
+        for _, size, path in sorted(stats):
+            if self._size <= self._max_size * CACHE_EVICT_RATIO:
+                break
+
+            _remove(path)
+            self._size -= size
+
+
+def _copy(src_file, dst) -> Tuple[int, int]:
+    """ copy an open file to a path or an open file, return the size and the crc32 of what has been copied """
+
+    dst_file = open(dst, 'wb') if isinstance(dst, str) else dst
+    size, checksum = 0, 0
+
+    try:
+        while chunk := src_file.read(MERGE_BUFFER_SIZE):
+            dst_file.write(chunk)
+            size += len(chunk)
+            checksum = zlib.crc32(chunk, checksum)
+    finally:
+        if dst_file is not dst:
+            dst_file.close()
+
+    return size, checksum
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,35 +1,77 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
-import functools
+import hashlib
 
 import aiohttp
 import asyncio
 
-from asyncio.tasks import Task
 from asyncio.exceptions import TimeoutError
+from collections import deque
+from itertools import islice
+from concurrent.futures import Executor, ThreadPoolExecutor
 from aiohttp.client import ClientError
 from tqdm import tqdm
-from queue import SimpleQueue
-from Crypto.Cipher import AES
+from printy import printy
+from urllib.parse import urljoin
 from typing import (
+    TYPE_CHECKING,
     Optional,
+    AsyncIterator,
+    Iterator,
+    Callable,
+    Iterable,
     Mapping,
-    Union
+    Tuple
 )
 
-from .session import _get
-from .parse import Parse
+from .session import _get, _new_session
+from .parse import Parse, Playlist, Variant
 from .merge import Merge
+from .writer import SliceWriter
+from .stream import SegmentStream
+from .table import SegmentTable
+from .manifest import Manifest
+from .adaptive import AdaptiveConcurrency
+from .retry import RetryPolicy, retry_after
+from .observer import Observer, JobSummary
+from .ratelimit import TokenBucket
+from .cache import SegmentCache
+from .selection import VariantPolicy, VariantProbe
+from .validate import InvalidSlice, KIND_TS, KIND_MP4, expected_container
 from .params_def import (
     EXIT_MIDWAY,
-    MAIN_ASYNC_TASK_SYMBOL,
     ASYNC_TASKS_MAINTAIN,
-    INSPECT_INTERVAL,
+    WORKERS_MAINTAIN,
     FETCH_FAILURE_TRIES,
+    CONNECTOR_LIMIT,
+    CONNECTOR_LIMIT_PER_HOST,
+    DNS_CACHE_TTL,
+    KEEPALIVE_TIMEOUT,
+    STREAM_CHUNK_SIZE,
+    STREAM_READ_AHEAD,
+    LIVE_DEFAULT_TARGET_DURATION,
+    RENDITION_TYPES,
+    RANGE_COALESCE_MAX,
+    RANGE_SPLIT_PARALLEL,
+    VARIANT_PROBE_SEGMENTS,
+    ADAPTIVE_MAX_WINDOW,
+    ADAPTIVE_PUSHBACK_STATUSES,
+    HEDGE_PERCENTILE,
+    HEDGE_DRAINED_PERCENTILE,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_SAMPLES,
+    HEDGE_MAX_IN_FLIGHT,
+    HEDGE_RECHECK_INTERVAL,
+    HEDGE_FILE_SUFFIX,
+    MANIFEST_FILE,
+    SCRATCH_DIR_SUFFIX,
     FILE_SC
 )
 
+if TYPE_CHECKING:
+    from .scheduler import Scheduler
+
 if sys.platform.startswith('win'):
     if sys.version_info >= (3, 8):
         # window policy
@@ -43,28 +85,70 @@ if sys.platform.startswith('win'):
 class Core:
     __slots__ = (
         "_m3u8_url",
-        "_host_url",
-        "_prefix_url",
+        "_base_url",
         "_video_path",
+        "_scratch_path",
         "_video_name",
         "_params",
         "_cookies",
         "_headers",
         "_proxy",
+        "_session",
+        "_session_owned",
+        "_connector_limit",
+        "_connector_limit_per_host",
+        "_dns_cache_ttl",
+        "_keepalive_timeout",
         "_AUTO_HIGHEST_BANDWIDTH",
+        "_variant_policy",
         "_async_tasks_maintain",
-        "_inspect_interval",
-        "_slices_urls",
-        "_slices_urls_failure",
-        "_slices_index_urls_ref",
+        "_slices",
+        "_range_coalesce",
+        "_range_split",
+        "_cache",
+        "_validate",
+        "_container",
+        "_hash_algorithm",
+        "_slices_queue",
         "_slices_total_num",
         "_slices_done_count",
         "_failure_retries",
-        "_failure_tries_count",
+        "_retry_policy",
+        "_executor",
+        "_executor_owned",
+        "_observers",
+        "_quiet",
+        "_bandwidth",
+        "_shared_bandwidth",
+        "_hedge",
+        "_hedge_url",
+        "_hedges_in_flight",
+        "_slice_durations",
+        "_start_time",
+        "_end_time",
+        "_segment_range",
+        "_trim",
+        "_start_position",
+        "_rendition_types",
+        "_renditions",
+        "_budget",
+        "_stream",
         "_merge",
         "_progress_bar",
         "_progress_bar_display",
-        "_decrypt_key"
+        "_decrypt_keys",
+        "_manifest",
+        "_resume",
+        "_remux",
+        "_live",
+        "_live_duration_limit",
+        "_live_size_limit",
+        "_live_next_sequence",
+        "_live_duration_count",
+        "_playlist_validators",
+        "_slices_bytes_count",
+        "_scheduler",
+        "_adaptive"
     )
 
     def __init__(
@@ -81,8 +165,39 @@ class Core:
         auto_highest_bandwidth: Optional[bool] = False,
         progress_bar_display: Optional[bool] = True,
         async_tasks_maintain: Optional[int] = ASYNC_TASKS_MAINTAIN,
-        inspect_interval: Optional[float] = INSPECT_INTERVAL,
-        failure_retries: Optional[int] = FETCH_FAILURE_TRIES
+        inspect_interval: Optional[float] = None,
+        failure_retries: Optional[int] = FETCH_FAILURE_TRIES,
+        session: Optional[aiohttp.ClientSession] = None,
+        connector_limit: Optional[int] = CONNECTOR_LIMIT,
+        connector_limit_per_host: Optional[int] = CONNECTOR_LIMIT_PER_HOST,
+        dns_cache_ttl: Optional[int] = DNS_CACHE_TTL,
+        keepalive_timeout: Optional[float] = KEEPALIVE_TIMEOUT,
+        resume: Optional[bool] = True,
+        remux: Optional[bool] = True,
+        live: Optional[bool] = False,
+        live_duration_limit: Optional[float] = None,
+        live_size_limit: Optional[int] = None,
+        scheduler: Optional["Scheduler"] = None,
+        adaptive_concurrency: Optional[bool] = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        executor: Optional[Executor] = None,
+        observers: Optional[Iterable[Observer]] = None,
+        quiet: Optional[bool] = False,
+        bandwidth_limit: Optional[float] = None,
+        bandwidth_limiter: Optional[TokenBucket] = None,
+        hedge: Optional[bool] = False,
+        hedge_url: Optional[Callable[[str], str]] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        segment_range: Optional[Tuple[int, Optional[int]]] = None,
+        trim: Optional[bool] = False,
+        renditions: Optional[Iterable[str]] = RENDITION_TYPES,
+        range_coalesce: Optional[int] = RANGE_COALESCE_MAX,
+        range_split: Optional[int] = None,
+        cache: Optional[SegmentCache] = None,
+        variant_policy: Optional[VariantPolicy] = None,
+        validate: Optional[bool] = True,
+        hash_algorithm: Optional[str] = None
     ) -> None:
         self._m3u8_url = m3u8_url
 
@@ -92,22 +207,146 @@ class Core:
         if any([ch in video_name for ch in FILE_SC]):
             raise ValueError("Invalid file name")
 
-        self._video_path = video_path + "//" if not video_path.endswith("//") else ''
+        self._video_path = video_path
         self._video_name = video_name + video_name_extension
+        self._scratch_path = os.path.join(video_path, self._video_name + SCRATCH_DIR_SUFFIX)
 
         self._params = params
         self._cookies = cookies
         self._headers = headers
         self._proxy = proxy
 
+        # an injected session is shared with the caller, which is responsible for closing it
+        self._session = session
+        self._session_owned = session is None
+        self._connector_limit = connector_limit if connector_limit >= 0 else CONNECTOR_LIMIT
+        self._connector_limit_per_host = (connector_limit_per_host
+                                          if connector_limit_per_host >= 0 else CONNECTOR_LIMIT_PER_HOST)
+        self._dns_cache_ttl = dns_cache_ttl
+        self._keepalive_timeout = keepalive_timeout
+
         self._AUTO_HIGHEST_BANDWIDTH = auto_highest_bandwidth
+        # picks the variant headlessly, ahead of `auto_highest_bandwidth`
+        self._variant_policy = variant_policy
 
         self._async_tasks_maintain = async_tasks_maintain if async_tasks_maintain > 0 else ASYNC_TASKS_MAINTAIN
-        self._inspect_interval = inspect_interval if inspect_interval > 0 else INSPECT_INTERVAL
+        # `inspect_interval` is kept for compatibility only, workers pick up slices as soon as they are free
         self._failure_retries = failure_retries if failure_retries > 0 else FETCH_FAILURE_TRIES
-
-        self._progress_bar_display = progress_bar_display
-        self._decrypt_key = None
+        self._retry_policy = retry_policy or RetryPolicy(tries=self._failure_retries)
+
+        # a thread pool by default, a process pool may be injected for heavy decryption
+        self._executor = executor
+        self._executor_owned = executor is None
+
+        # nothing is written to the console in quiet mode, progress is only reported to the observers
+        self._quiet = quiet
+        self._observers = list(observers or ())
+        self._progress_bar_display = progress_bar_display and not quiet
+
+        # bytes per second of this job, and a bucket shared with other jobs
+        self._bandwidth = TokenBucket(bandwidth_limit)
+        self._shared_bandwidth = bandwidth_limiter
+
+        # stragglers are fetched twice, optionally from another origin mapped by `hedge_url`
+        self._hedge = hedge
+        self._hedge_url = hedge_url
+        self._hedges_in_flight = 0
+        self._slice_durations = deque(maxlen=HEDGE_SAMPLES)
+
+        # partial download, either by time in seconds or by segment indexes `[first, last)`
+        if segment_range and (start_time is not None or end_time is not None):
+            raise ValueError("`segment_range` and `start_time`/`end_time` can not be used together")
+
+        if (segment_range or start_time is not None or end_time is not None) and live:
+            raise ValueError("partial downloads are not supported in live mode")
+
+        if trim and not remux:
+            raise ValueError("`trim` requires `remux`")
+
+        if trim and start_time is None and end_time is None:
+            raise ValueError("`trim` requires `start_time` or `end_time`")
+
+        if live_duration_limit is not None and live_duration_limit <= 0:
+            raise ValueError("`live_duration_limit` must be positive")
+
+        if live_size_limit is not None and live_size_limit <= 0:
+            raise ValueError("`live_size_limit` must be positive")
+
+        self._start_time = start_time
+        self._end_time = end_time
+        self._segment_range = segment_range
+        # (offset into the first slice, duration) to be cut out exactly while remuxing
+        self._trim = trim
+        # playlist time at which the first slice fetched starts, for the renditions to be lined up with the video
+        self._start_position = 0.
+
+        # `EXT-X-MEDIA` types of the chosen variant to be fetched along with the video and muxed into it
+        self._rendition_types = tuple(renditions or ())
+        self._renditions = []
+        # in-flight slots shared by the video and its renditions, when the number of them is limited
+        self._budget = None
+
+        # `EXT-X-BYTERANGE` slices of a file which follow one another are fetched together up to this many bytes,
+        # and slices larger than `range_split` bytes are fetched in parts of that size side by side
+        self._range_coalesce = range_coalesce
+        self._range_split = range_split
+
+        # slices are looked up locally before going to the network, and stored there once fetched
+        self._cache = cache
+
+        # a broken slice, cut short, of a broken container or an error page, is fetched again as soon as it is seen
+        self._validate = validate
+        # the container of the slices which can not be told by their uris, that of the first one validated
+        self._container = None
+        # a digest of every slice as received is reported to the observers, see `hashlib.new`
+        if hash_algorithm:
+            hashlib.new(hash_algorithm)
+        self._hash_algorithm = hash_algorithm
+
+        self._decrypt_keys = {}
+
+        # slices of a live stream shift between runs, so there is nothing to resume from
+        self._resume = resume and not live
+        self._remux = remux
+
+        self._live = live
+        self._live_duration_limit = live_duration_limit
+        self._live_size_limit = live_size_limit
+        self._live_duration_count = 0.
+        self._playlist_validators = {}
+        self._slices_bytes_count = 0
+
+        # in-flight slots shared with other jobs, see `Scheduler`
+        self._scheduler = scheduler
+
+        # `async_tasks_maintain` turns into the upper bound of the window in adaptive mode
+        self._adaptive = AdaptiveConcurrency(
+            self._async_tasks_maintain if self._async_tasks_maintain != ASYNC_TASKS_MAINTAIN else ADAPTIVE_MAX_WINDOW
+        ) if adaptive_concurrency else None
+        self._manifest = Manifest(os.path.join(self._scratch_path, MANIFEST_FILE))
+        self._merge = None
+        self._progress_bar = None
+        # slices are streamed to the consumer of `iter_segments` instead of being merged on disk when set
+        self._stream = None
+
+    @property
+    def concurrency_window(self) -> Optional[int]:
+        """ number of slice requests currently allowed in flight, `None` for no limit """
+
+        if self._adaptive:
+            return self._adaptive.window
+
+        return self._async_tasks_maintain if self._async_tasks_maintain != ASYNC_TASKS_MAINTAIN else None
+
+    @property
+    def bandwidth_limit(self) -> Optional[float]:
+        """ bytes per second, `None` for no limit; a new value takes effect on the running download as well """
+
+        return self._bandwidth.rate
+
+    @bandwidth_limit.setter
+    def bandwidth_limit(self, rate: Optional[float]) -> None:
+        self._bandwidth.rate = rate
 
     def __enter__(self):
         return self
@@ -116,228 +355,1007 @@ class Core:
         pass
 
     async def download(self) -> None:
-        m3u8_url_seq = await self._specify_stream()
-        await self._fetch_seq_slices(m3u8_url_seq)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        await self._fetch()
+
+        download_elapsed = loop.time() - start
+
+        # ffmpeg may take a while, other jobs on the loop keep going in the meantime
+        await loop.run_in_executor(None, self._merge.start)
+        self._manifest.remove()
+
+        if self._observers:
+            self._emit("on_job_finished", JobSummary(self._video_name, self._slices_total_num,
+                                                     self._slices_bytes_count, self._slices.retries,
+                                                     download_elapsed, loop.time() - start - download_elapsed))
+
+    async def iter_segments(self, read_ahead: int = STREAM_READ_AHEAD) -> AsyncIterator[bytes]:
+        """
+        yield the decrypted slices in playlist order as they arrive, nothing is written to disk
+        at most `read_ahead` slices are fetched past the one the consumer is waiting for
+        """
+
+        if self._hedge:
+            raise ValueError("`hedge` is not supported when streaming")
+
+        self._stream = SegmentStream(read_ahead)
+        # nothing on disk to resume from
+        self._resume = False
+        self._manifest = None
+
+        fetching = asyncio.create_task(self._fetch())
+        fetching.add_done_callback(
+            lambda task: self._stream.finish(None if task.cancelled() else task.exception()))
+
+        try:
+            async for data in self._stream:
+                yield data
+        finally:
+            fetching.cancel()
+            await asyncio.gather(fetching, return_exceptions=True)
+
+    async def _fetch(self) -> None:
+        """ fetch all slices of the stream, to the disk or to the consumer of `iter_segments` """
+
+        if self._session_owned:
+            self._session = _new_session(self._connector_limit, self._connector_limit_per_host,
+                                         self._dns_cache_ttl, self._keepalive_timeout)
+
+        if self._executor_owned:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="aiom3u8")
+
+        try:
+            # playlists, key and slices are all fetched through the same warm connection pool
+            m3u8_url_seq = await self._specify_stream()
+
+            if self._renditions and not (self._live or self._stream):
+                await self._fetch_with_renditions(m3u8_url_seq)
+            else:
+                await self._fetch_seq_slices(m3u8_url_seq)
+        finally:
+            if self._manifest:
+                self._manifest.close()
+
+            if self._merge:
+                # the slices being appended land before the file is closed
+                await asyncio.gather(self._merge.flush(), return_exceptions=True)
+                self._merge.close()
+
+            if self._session_owned:
+                await self._session.close()
+
+            if self._executor_owned:
+                self._executor.shutdown(wait=False)
 
-        self._progress_bar.close()
-        self._merge.start()
+            if self._progress_bar:
+                self._progress_bar.close()
+
+    def _emit(self, event: str, *args) -> None:
+        for observer in self._observers:
+            getattr(observer, event)(self._video_name, *args)
 
     async def _specify_stream(self) -> str:
         """ specify an adaptation stream """
 
-        if all(ret_val := Parse.url(self._m3u8_url)):
-            self._host_url = ret_val[0][0][: -1]
-            self._prefix_url = ret_val[1][0][: -1]
-        else:
+        if not Parse.is_url(self._m3u8_url):
             raise ValueError("Invalid m3u8 addr")
 
-        async with aiohttp.ClientSession() as session:
-            resp = await _get(session, self._m3u8_url, self._failure_retries, params=self._params,
-                              cookies=self._cookies, headers=self._headers, proxy=self._proxy)
+        resp = await self._get(self._m3u8_url)
 
+        if not resp or resp.status != 200:
+            if resp:
+                resp.release()
+            raise Exception("m3u8 url is not available")
+
+        playlist = Parse.playlist(await resp.text())
+        if variants := playlist.variants:
+            # multi-rate adaptation stream
+
+            if self._variant_policy:
+                variant = await self._variant_policy.select(variants, self._probe_variant)
+            elif self._AUTO_HIGHEST_BANDWIDTH or self._quiet or not (sys.stdin and sys.stdin.isatty()):
+                # quality stream picked automatically, nobody would answer the prompt without a terminal
+                variant = max(variants, key=lambda variant_: variant_.bandwidth)
+            else:
+                variant = self._choose_variant(variants)
+
+            self._renditions = self._select_renditions(playlist.media, variant)
+
+            return urljoin(self._m3u8_url, variant.uri)
+
+        elif playlist.segments:
+            return self._m3u8_url
+        else:
+            raise Exception("Unresolved m3u8 content")
+
+    @staticmethod
+    def _choose_variant(variants: list) -> Variant:
+        for index, variant in enumerate(variants):
+            print(f"{index + 1} - bandwidth[{variant.bandwidth}]")
+
+        print("Select a specific quality video stream from above, `0` for quit")
+        while True:
+            _c = int(input("choice: "))
+
+            if not _c:
+                exit(EXIT_MIDWAY)
+            elif 0 < _c <= len(variants):
+                return variants[_c - 1]
+
+    async def _probe_variant(self, variant: Variant) -> Optional[VariantProbe]:
+        """ fetch the first few slices of the variant, `None` if it is not available """
+
+        loop = asyncio.get_running_loop()
+        url = urljoin(self._m3u8_url, variant.uri)
+
+        try:
+            resp = await self._get(url)
             if not resp or resp.status != 200:
-                raise Exception("m3u8 url is not available")
-
-            resp_text = await resp.text()
-            if len(ret := Parse.fetch_multi_rate_adaptation(resp_text)):
-                # multi-rate adaptation stream
-
-                _b = int(ret[0][0])
-                _u = ret[0][1]
-                for (index, (bandwidth, resource_addr)) in enumerate(ret):
-                    if self._AUTO_HIGHEST_BANDWIDTH:
-                        if _b < int(bandwidth):
-                            _b = int(bandwidth)
-                            _u = resource_addr
-                    else:
-                        print(f"{index + 1} - bandwidth[{bandwidth}]")
-
-                if self._AUTO_HIGHEST_BANDWIDTH:
-                    # quality stream picked automatically
-                    return (self._host_url if _u[0] == '/' else self._prefix_url) + _u
-                else:
-                    print("Select a specific quality video stream from above, `0` for quit")
-                    while True:
-                        _c = int(input("choice: "))
+                if resp:
+                    resp.release()
+                return None
+
+            segments = Parse.playlist(await resp.text()).segments
+            if not segments:
+                return None
+
+            sample = segments[: VARIANT_PROBE_SEGMENTS]
+            sample_size = 0
+            start = loop.time()
+
+            for segment in sample:
+                length, first = segment.byterange or (None, 0)
+                resp = await self._get(urljoin(url, segment.uri),
+                                       headers=_range_header(first, first + length) if length else None)
+
+                if not resp or resp.status not in (200, 206):
+                    if resp:
+                        resp.release()
+                    return None
+
+                received = 0
+                async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    received += len(chunk)
+
+                    if length and received >= length:
+                        # the server does not serve ranges, the rest of the file is of no use
+                        resp.close()
+                        break
 
-                        if not _c:
-                            exit(EXIT_MIDWAY)
-                        elif 0 < _c <= len(ret):
-                            return (self._host_url if ret[_c-1][1][0] == '/' else self._prefix_url) + ret[_c-1][1]
+                sample_size += min(received, length) if length else received
+        except (ClientError, TimeoutError):
+            return None
 
-            elif len(Parse.fetch_media_sequential_slices(resp_text)):
-                return self._m3u8_url
-            else:
-                raise Exception("Unresolved m3u8 content")
+        return VariantProbe(variant, len(segments), len(sample), sample_size, loop.time() - start)
+
+    def _select_renditions(self, media: list, variant: Variant) -> list:
+        """
+        one rendition of every group the variant refers to, the default one if any,
+        renditions without an uri are carried by the variant itself
+        """
+
+        renditions = []
+
+        for media_type in self._rendition_types:
+            # the attribute of `EXT-X-STREAM-INF` is named after the type of the group
+            if (group_id := variant.attributes.get(media_type)) is None:
+                continue
+
+            group = [media_ for media_ in media
+                     if media_.type == media_type and media_.group_id == group_id and media_.uri]
+
+            if group:
+                renditions.append(next((media_ for media_ in group if media_.default), group[0]))
+
+        return renditions
+
+    async def _fetch_with_renditions(self, m3u8_url_seq: str) -> None:
+        """
+        fetch the alternate renditions side by side with the video, each of them is a job of its own
+        on the same session, executor and in-flight budget, whose concatenated stream is muxed into the video
+        """
+
+        loop = asyncio.get_running_loop()
+
+        if not self._adaptive and self._async_tasks_maintain != ASYNC_TASKS_MAINTAIN:
+            self._budget = asyncio.Semaphore(self._async_tasks_maintain)
+
+        jobs = [self._rendition_job(index, media) for index, media in enumerate(self._renditions)]
+
+        async def _fetch_rendition(job: Core) -> None:
+            await job._fetch()
+            await loop.run_in_executor(None, job._merge.start)
+            job._manifest.remove()
+
+        tasks = [asyncio.create_task(self._fetch_seq_slices(m3u8_url_seq)),
+                 *(asyncio.create_task(_fetch_rendition(job)) for job in jobs)]
+
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            rets = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for ret in rets:
+            if isinstance(ret, Exception):
+                raise ret
+
+        for job, media in zip(jobs, self._renditions):
+            self._merge.add_rendition(os.path.join(self._scratch_path, job._video_name), media.type,
+                                      job._start_position - self._start_position)
+            self._slices_bytes_count += job._slices_bytes_count
+
+    def _rendition_job(self, index: int, media) -> "Core":
+        job = Core(
+            urljoin(self._m3u8_url, media.uri),
+            self._scratch_path,
+            # named after the video, for the observers of many jobs to tell them apart
+            f"{self._video_name}.{media.type.lower()}-{index}",
+            video_name_extension='',
+            params=self._params,
+            cookies=self._cookies,
+            headers=self._headers,
+            proxy=self._proxy,
+            progress_bar_display=False,
+            async_tasks_maintain=self._async_tasks_maintain,
+            failure_retries=self._failure_retries,
+            session=self._session,
+            resume=self._resume,
+            remux=False,
+            scheduler=self._scheduler,
+            retry_policy=self._retry_policy,
+            executor=self._executor,
+            observers=self._observers,
+            quiet=True,
+            bandwidth_limiter=self._shared_bandwidth,
+            hedge=self._hedge,
+            hedge_url=self._hedge_url,
+            start_time=self._start_time,
+            end_time=self._end_time,
+            segment_range=self._segment_range,
+            renditions=(),
+            range_coalesce=self._range_coalesce,
+            range_split=self._range_split,
+            cache=self._cache,
+            validate=self._validate,
+            hash_algorithm=self._hash_algorithm
+        )
+
+        # the budget of the job is shared rather than multiplied
+        job._adaptive = self._adaptive
+        job._budget = self._budget
+        job._bandwidth = self._bandwidth
+
+        return job
 
     async def _fetch_seq_slices(
         self, m3u8_url_seq: str
     ) -> None:
         """ fetch all stream slices in current m3u8 file """
 
-        if all(ret_val := Parse.url(m3u8_url_seq)):
-            self._host_url = ret_val[0][0][: -1]
-            self._prefix_url = ret_val[1][0]
-        else:
+        if not Parse.is_url(m3u8_url_seq):
             raise ValueError("Invalid m3u8 addr")
 
-        async with aiohttp.ClientSession() as session:
-            resp = await _get(session, m3u8_url_seq, self._failure_retries, params=self._params,
-                              cookies=self._cookies, headers=self._headers, proxy=self._proxy)
+        # relative uris in the media playlist are resolved against it
+        self._base_url = m3u8_url_seq
 
-            if not resp or resp.status != 200:
-                raise Exception("m3u8 url sequences is not available")
+        playlist = await self._fetch_media_playlist(m3u8_url_seq)
+
+        segments = playlist.segments
+        if not segments:
+            raise Exception("Unresolved m3u8 content")
+
+        if self._live:
+            self._live_next_sequence = playlist.media_sequence + len(segments)
+            segments = segments[: self._live_take(segments)]
+        else:
+            segments = self._select_segments(segments)
+
+        if self._range_coalesce:
+            segments = Parse.coalesce_ranges(segments, self._range_coalesce)
+
+        await self._fetch_decrypt_keys(segments)
+
+        if self._stream:
+            self._stream.setup(segments[0].map)
+            self._merge = self._stream
+        else:
+            os.makedirs(self._scratch_path, exist_ok=True)
+            self._merge = Merge(self._video_path, self._video_name, len(segments), self._remux, segments[0].map,
+                                self._scratch_path, self._quiet, self._trim or None)
+
+        self._slices = SegmentTable(m3u8_url_seq)
+
+        if self._merge.pre_uri:
+            # the init video is not encrypted by the keys of media slices
+            self._slices.append(self._merge.pre_uri, segments[0].map.byterange)
+
+        self._slices_append(segments)
+        await self._slices_urls_manager()
+        self._progress_bar = tqdm(total=self._slices_total_num,
+                                  initial=self._slices_done_count,
+                                  desc="Downloading",
+                                  ncols=100) if self._progress_bar_display else None
+
+        if self._adaptive:
+            # enough workers for the largest window, the controller decides how many of them are let through
+            workers_num = self._adaptive.max_window
+        elif self._async_tasks_maintain == ASYNC_TASKS_MAINTAIN:
+            # a worker more than the pooled connections would only wait for one
+            workers_num = min(self._connector_limit or WORKERS_MAINTAIN, WORKERS_MAINTAIN)
+        else:
+            workers_num = self._async_tasks_maintain
+
+        if not self._live:
+            # no more slices than those queued
+            workers_num = min(workers_num, self._slices_queue.qsize())
+
+        if self._stream:
+            # the others would only wait for the consumer
+            workers_num = min(workers_num, self._stream.read_ahead)
+
+        if self._live:
+            # more slices are yet to come
+            workers_num = max(workers_num, 1)
+            queue_joined = asyncio.create_task(self._poll_live_playlist(m3u8_url_seq, playlist))
+        else:
+            queue_joined = asyncio.create_task(self._slices_queue.join())
+
+        workers = [asyncio.create_task(self._slices_worker()) for _ in range(workers_num)]
+
+        try:
+            # returns either when all slices are done or any worker gives up
+            await asyncio.wait([queue_joined, *workers], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            queue_joined.cancel()
+            for worker in workers:
+                worker.cancel()
+
+            rets = await asyncio.gather(queue_joined, *workers, return_exceptions=True)
+
+        for ret in rets:
+            if isinstance(ret, Exception):
+                raise ret
+
+        await self._merge.flush()
+
+    def _select_segments(self, segments: list) -> list:
+        """ the segments of a partial download, only the ones covering the time range when it is given """
+
+        if self._segment_range:
+            first, last = self._segment_range
+            self._start_position = sum(segment.duration for segment in segments[: first])
+            segments = segments[first: last]
+
+            if not segments:
+                raise ValueError("the segment range is out of the playlist")
+
+        elif self._start_time is not None or self._end_time is not None:
+            first, last, offset = Parse.time_range(segments, self._start_time, self._end_time)
+            self._start_position = (self._start_time or 0.) - offset
+            segments = segments[first: last]
+
+            if self._trim:
+                self._trim = (offset, self._end_time - (self._start_time or 0.) if self._end_time is not None else None)
+
+        return segments
+
+    async def _poll_live_playlist(self, m3u8_url_seq: str, playlist: Playlist) -> None:
+        """
+        keep refreshing the media playlist of a live stream and queue the slices that are new to us,
+        until `EXT-X-ENDLIST` shows up or any limit is reached, then wait for the queued slices
+        """
+
+        target_duration = playlist.target_duration or LIVE_DEFAULT_TARGET_DURATION
+        changed = True
+
+        while not playlist.end_list and not self._live_limit_reached():
+            # a playlist that has not changed is reloaded sooner, as suggested by the HLS spec
+            await asyncio.sleep(target_duration if changed else target_duration / 2)
+
+            if (playlist_ := await self._fetch_media_playlist(m3u8_url_seq)) is None:
+                changed = False
+                continue
+
+            playlist = playlist_
+            target_duration = playlist.target_duration or target_duration
+
+            # de-duplicate by media sequence number, the slices before it are scheduled already
+            segments = playlist.segments[max(self._live_next_sequence - playlist.media_sequence, 0):]
+            changed = bool(segments)
+            if not changed:
+                continue
+
+            self._live_next_sequence = playlist.media_sequence + len(playlist.segments)
+            segments = segments[: self._live_take(segments)]
+
+            if self._range_coalesce:
+                segments = Parse.coalesce_ranges(segments, self._range_coalesce)
+
+            await self._fetch_decrypt_keys(segments)
+            self._slices_urls_extend(segments)
+
+        await self._slices_queue.join()
+
+    def _live_take(self, segments: list) -> int:
+        """ number of the new slices to be scheduled within `live_duration_limit` """
+
+        if self._live_duration_limit is None:
+            return len(segments)
+
+        for taken, segment in enumerate(segments):
+            if self._live_duration_count >= self._live_duration_limit:
+                return taken
+
+            self._live_duration_count += segment.duration
+
+        return len(segments)
+
+    def _live_limit_reached(self) -> bool:
+        return ((self._live_duration_limit is not None
+                 and self._live_duration_count >= self._live_duration_limit)
+                or (self._live_size_limit is not None
+                    and self._slices_bytes_count >= self._live_size_limit))
+
+    async def _fetch_media_playlist(self, m3u8_url_seq: str) -> Optional[Playlist]:
+        """ conditional request of the media playlist, `None` if it has not been modified since last fetch """
+
+        headers = {}
+        if validators := self._playlist_validators.get(m3u8_url_seq):
+            etag, last_modified = validators
+
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
 
-            text = await resp.text()
+        resp = await self._get(m3u8_url_seq, headers=headers)
 
-            slices = Parse.fetch_media_sequential_slices(text)
-            if not slices:
-                raise Exception("Unresolved m3u8 content")
+        if resp and resp.status == 304:
+            resp.release()
+            return None
 
-            await self._fetch_decrypt_key(session, Parse.key(text))
+        if not resp or resp.status != 200:
+            if resp:
+                resp.release()
+            raise Exception("m3u8 url sequences is not available")
+
+        self._playlist_validators[m3u8_url_seq] = (resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
 
-            # Note: init video uri has been added into slices list if it has
-            self._merge = Merge(text, self._video_path, self._video_name, slices)
-            self._progress_bar = tqdm(total=len(slices),
-                                      desc="Downloading",
-                                      ncols=100) if self._progress_bar_display else None
+        return Parse.playlist(await resp.text())
 
-            if not slices[0].startswith("http"):
-                _ = self._host_url if slices[0][0] == '/' else self._prefix_url
-                slices = [_ + slice_ for slice_ in slices]
+    async def _slices_worker(self) -> None:
+        """ long-lived worker which keeps pulling slices from queue until cancelled """
 
-            self._slices_urls_manager(init=True, urls=slices)
+        while True:
+            index = await self._slices_queue.get()
 
-            self._failure_tries_count = 0
-            _slices_urls_init_size = self._slices_urls.qsize()
-            while True:
-                # calculate the number of adding async tasks in this round
-                supply_num = (_slices_urls_init_size
-                              if self._async_tasks_maintain == ASYNC_TASKS_MAINTAIN else
-                              self._async_tasks_maintain) + MAIN_ASYNC_TASK_SYMBOL - len(asyncio.all_tasks())
+            if self._stream:
+                await self._stream.window(index)
 
-                if supply_num:
-                    urls_batch = self._slices_urls_manager(init=False, gain=supply_num)
+            if self._adaptive:
+                await self._adaptive.acquire()
+            elif self._budget:
+                await self._budget.acquire()
 
-                    if not urls_batch and len(self._slices_urls_failure):
-                        if self._failure_tries_count < self._failure_retries:
-                            # redo failure tasks
-                            self._failure_tries_count += 1
-                            urls_batch = self._slices_urls_failure.copy()
-                        else:
-                            raise Exception("part of slices can not be downloaded, "
-                                            "or try to increase the number of `failure_retries` argument")
+            invalid = False
 
-                    # async tasks payload
-                    tasks = [
-                        asyncio.create_task(self._fetch_single_slice(session, url), name=url)
-                        for url in urls_batch
-                    ]
+            try:
+                if self._scheduler:
+                    async with self._scheduler.slot(self, self._slices.url(index)):
+                        succeeded = await self._fetch_single_slice(index)
+                else:
+                    succeeded = await self._fetch_single_slice(index)
+            except InvalidSlice:
+                succeeded, invalid = False, True
+            finally:
+                if self._adaptive:
+                    self._adaptive.release()
+                elif self._budget:
+                    self._budget.release()
+
+            if succeeded:
+                self._slices_done_count += 1
+                self._merge.slice_done(index)
+
+                if self._progress_bar_display:
+                    self._progress_bar.update(1)
+            else:
+                retries = self._slices.retry(index)
+                if retries > self._failure_retries:
+                    self._emit("on_segment_failed", index, "retries exhausted")
+                    raise Exception("part of slices can not be downloaded, "
+                                    "or try to increase the number of `failure_retries` argument")
 
-                    for task in tasks:
-                        task.add_done_callback(functools.partial(self._task_done_callback))
+                self._emit("on_segment_retried", index, retries)
 
-                    # keep from fetching the failed slices that have no results yet
-                    self._slices_urls_failure.clear()
+                # a broken slice is fetched again right away, the server is not to blame for the pace,
+                # while a slice which failed midway backs off the same as a request does
+                if not invalid:
+                    await asyncio.sleep(self._retry_policy.backoff(retries))
 
-                # yield from current main process to handle slices tasks
-                await asyncio.sleep(self._inspect_interval)
+                # put back before `task_done` so that the queue would not be joined in the meantime
+                self._slices_queue.put_nowait(index)
 
-                if self._slices_total_num == self._slices_done_count:
-                    break
+            self._slices_queue.task_done()
 
-    async def _fetch_single_slice(
-        self, session: aiohttp.ClientSession, url: str
-    ) -> bool:
+    async def _fetch_single_slice(self, index: int) -> bool:
         """ single slice download coroutine """
 
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self._emit("on_segment_started", index)
+
+        if self._cache and (cached := await self._restore_cached_slice(index)):
+            size, checksum = cached
+            self._slices_bytes_count += size
+            if self._manifest:
+                self._manifest.record(index, size, checksum)
+            self._emit("on_segment_completed", index, size, loop.time() - start)
+
+            return True
+
+        if self._hedge:
+            fetched = await self._fetch_slice_hedged(index, start)
+        else:
+            fetched = await self._fetch_slice_to(index, self._slices.url(index), self._merge.slice_path(index))
+
+        if not fetched:
+            return False
+
+        size, checksum, latency, digest = fetched
+        elapsed = loop.time() - start
+
+        if self._adaptive:
+            self._adaptive.on_success(latency, size)
+
+        self._slice_durations.append(elapsed)
+        self._slices_bytes_count += size
+        if self._manifest:
+            self._manifest.record(index, size, checksum)
+        if digest:
+            self._emit("on_segment_digest", index, digest)
+        self._emit("on_segment_completed", index, size, elapsed)
+
+        return True
+
+    async def _fetch_slice_to(
+        self, index: int, url: str, path: str, report_failure: bool = True
+    ) -> Optional[Tuple[int, int, float, Optional[str]]]:
+        """
+        fetch a slice from `url` into `path`, return its size, crc32, time to first byte and digest,
+        `None` on failure, raises `InvalidSlice` if what has been fetched is broken
+        without `report_failure`, a slice which is not available is left to the caller to report
+        """
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        # bytes `[first, stop)` of the file, `stop` is `None` for up to its end
+        if byterange := self._slices.byterange(index):
+            length, first = byterange
+            stop = first + length
+        else:
+            first, stop = 0, None
+
+        # a large slice is fetched in parts, the first of which tells the size of the slice if the playlist does not
+        head_stop = stop
+        if self._range_split and (stop is None or stop - first > self._range_split):
+            head_stop = first + self._range_split
+
+        # parts of the slice fetched ahead of the one being written, on top of the request of the slice itself,
+        # so that neither the parts in flight nor the ones waiting to be written run over `RANGE_SPLIT_PARALLEL`
+        parts = deque()
+        ranges = iter(())
+
         try:
-            resp = await _get(session, url, self._failure_retries, params=self._params,
-                              cookies=self._cookies, headers=self._headers, proxy=self._proxy)
+            resp = await self._get(url, headers=_range_header(first, head_stop) if byterange or head_stop else None,
+                                   on_failure=self._on_slice_failure if self._adaptive else None,
+                                   defer_success=True)
             if not resp:
-                return False
+                return None
+
+            if resp.status not in (200, 206):
+                resp.release()
 
-            file_name = url[url.rfind('/') + 1:]
+                if self._retry_policy.is_retryable(resp.status):
+                    return None
 
-            if self._merge.is_slices_replace:
-                # replace file name in reflection list provided by `Merge`
-                file_name = self._merge.slices_replace_reflection[url]
+                # the body of an error page is never written as a slice
+                if report_failure:
+                    self._emit("on_segment_failed", index, f"status {resp.status}")
+                raise Exception(f"slice is not available, status {resp.status}: {url}")
 
-            with open(os.path.join(self._video_path, file_name), 'wb') as slice_file:
-                _content = await resp.read()
-                slice_file.write(self._decrypt_key.decrypt(_content) if self._decrypt_key else _content)
+            latency = loop.time() - start
+            self._emit("on_segment_first_byte", index, latency)
+
+            if resp.status == 206:
+                if head_stop != stop:
+                    stop = stop or _content_range_stop(resp.headers)
+                    ranges = _split_range(head_stop, stop, self._range_split)
+                    parts.extend(asyncio.create_task(self._fetch_range(index, url, part_first, part_stop))
+                                 for part_first, part_stop in islice(ranges, RANGE_SPLIT_PARALLEL))
+
+                body = self._read_body(index, resp)
+            else:
+                # the server does not serve ranges, the slice is cut out of the whole file
+                body = self._read_body(index, resp, first, stop - first if stop is not None else None)
+
+            key, iv = None, None
+            if slice_key := self._slices.key(index):
+                key_url, iv = slice_key
+                key = self._decrypt_keys[key_url]
+
+            # decryption, validation and disk writes run in the executor while the body keeps streaming in
+            container = (expected_container(self._slices.url(index), self._merge.pre_uri is not None)
+                         or self._container)
+            writer = SliceWriter(path, self._executor, key, iv, self._validate, container)
+            hasher = hashlib.new(self._hash_algorithm) if self._hash_algorithm else None
+
+            try:
+                async for chunk in body:
+                    if hasher:
+                        hasher.update(chunk)
+                    await writer.write(chunk)
+
+                # the parts that arrive early wait for the ones before them
+                while parts:
+                    if (data := await parts[0]) is None:
+                        await writer.discard()
+                        return None
+
+                    parts.popleft()
+                    if range_ := next(ranges, None):
+                        parts.append(asyncio.create_task(self._fetch_range(index, url, *range_)))
+
+                    if hasher:
+                        hasher.update(data)
+                    await writer.write(data)
+            except BaseException:
+                await writer.discard()
+                raise
+
+            size, checksum = await writer.close()
+            self._retry_policy.breaker(url).success()
+
+            if self._container is None and writer.container in (KIND_TS, KIND_MP4):
+                self._container = writer.container
+
+            data = writer.data if path is None else None
+            if path is None:
+                # streamed, the slice stays in memory until it is consumed
+                self._merge.keep(index, data)
+
+            if self._cache:
+                await loop.run_in_executor(None, self._cache.put, self._cache_key(index), path, data)
         except (ClientError, TimeoutError):
-            return False
+            # the request went through, so the origin is only seen failing here, e.g. when it resets midway
+            self._retry_policy.breaker(url).failure()
+            if self._adaptive:
+                self._adaptive.on_pushback()
 
-        return True
+            return None
+        finally:
+            for part in parts:
+                part.cancel()
 
-    async def _fetch_decrypt_key(self, session, key_):
-        if not key_:
-            return
+            await asyncio.gather(*parts, return_exceptions=True)
 
-        key_method = key_[0][0]
-        key_url = key_[0][1]
+        return size, checksum, latency, hasher.hexdigest() if hasher else None
 
-        if key_method != "AES-128":
-            raise Exception("unresolved encryption method")
+    async def _fetch_range(
+        self, index: int, url: str, first: int, stop: Optional[int]
+    ) -> Optional[bytes]:
+        """ one part of a slice fetched in parts, `None` on failure """
 
-        if not key_url.startswith("http"):
-            key_url = (self._host_url if key_url[0] == '/' else self._prefix_url) + key_url
+        try:
+            resp = await self._get(url, headers=_range_header(first, stop), defer_success=True)
+            if not resp:
+                return None
 
-        resp = await _get(session, key_url, self._failure_retries, params=self._params,
-                          cookies=self._cookies, headers=self._headers, proxy=self._proxy)
+            if resp.status != 206:
+                resp.release()
+                return None
 
-        if not resp or resp.status != 200:
-            raise Exception("unavailable encryption key url")
+            data = b''.join([chunk async for chunk in self._read_body(index, resp)])
+            self._retry_policy.breaker(url).success()
 
-        key_text = await resp.read()
-        self._decrypt_key = AES.new(key_text, AES.MODE_CBC)
+            return data
+        except (ClientError, TimeoutError):
+            self._retry_policy.breaker(url).failure()
+            return None
 
-    def _slices_urls_manager(
-        self, *, init: bool, urls: Optional[list] = None, gain: Optional[int] = 0
-    ) -> Union[None, list]:
+    async def _read_body(
+        self, index: int, resp, skip: int = 0, take: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
         """
-            continuously return a group of urls that should be handled as async tasks
-            OR
-            build up a queue that contain all urls
+        chunks of the response body, `take` bytes after the first `skip` ones if given,
+        raises `InvalidSlice` if the body is cut short of its `Content-Length`
         """
 
-        if init:
-            if not urls:
-                raise ValueError("`urls` must not be empty while `init` is positive")
+        received = 0
 
-            # build up
-            self._slices_total_num = len(urls)
-            self._slices_done_count = 0
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+            received += len(chunk)
+            self._emit("on_segment_bytes", index, len(chunk))
 
-            self._slices_urls = SimpleQueue()
-            self._slices_urls_failure = []
+            # the socket is not read again until the chunk is paid for
+            await self._bandwidth.consume(len(chunk))
+            if self._shared_bandwidth:
+                await self._shared_bandwidth.consume(len(chunk))
 
-            for url in urls:
-                self._slices_urls.put(url)
-        else:
-            # reap
-            rets = []
+            if skip:
+                skipped = min(skip, len(chunk))
+                chunk, skip = chunk[skipped:], skip - skipped
+
+            if take is not None:
+                chunk, take = chunk[: take], take - min(take, len(chunk))
+
+            if chunk:
+                yield chunk
+
+            if take == 0:
+                # the rest of the file is of no use
+                resp.close()
+                return
+
+        # the length of an encoded body is that of the encoded bytes
+        if (self._validate and resp.content_length is not None and "Content-Encoding" not in resp.headers
+                and received != resp.content_length):
+            raise InvalidSlice(f"body of {received} bytes, {resp.content_length} expected")
+
+    async def _fetch_slice_hedged(
+        self, index: int, start: float
+    ) -> Optional[Tuple[int, int, float, Optional[str]]]:
+        """
+        fetch a slice, and once it takes longer than most of its peers have taken, fetch it once more in parallel,
+        from `hedge_url` if given, the first one to succeed wins and the other one is cancelled
+        an error of the primary is only raised once the hedge has failed as well, that of the hedge never is
+        """
 
-            if gain > 0:
-                for i in range(gain):
-                    if not self._slices_urls.qsize():
+        loop = asyncio.get_running_loop()
+        url, path = self._slices.url(index), self._merge.slice_path(index)
+        primary = asyncio.create_task(self._fetch_slice_to(index, url, path, report_failure=False))
+        hedge = None
+
+        try:
+            while not primary.done():
+                threshold = self._hedge_threshold()
+                elapsed = loop.time() - start
+
+                if threshold is not None and elapsed >= threshold:
+                    if self._hedges_in_flight < HEDGE_MAX_IN_FLIGHT:
                         break
 
-                    rets.append(self._slices_urls.get())
+                    # a straggler waits for a hedge to be let through
+                    timeout = HEDGE_RECHECK_INTERVAL
+                elif threshold is None:
+                    timeout = HEDGE_RECHECK_INTERVAL
+                else:
+                    timeout = min(threshold - elapsed, HEDGE_RECHECK_INTERVAL)
+
+                # checked again now and then, the threshold drops once the queue is drained
+                await asyncio.wait({primary}, timeout=timeout)
+
+            if primary.done():
+                if primary.exception():
+                    self._on_hedged_error(index, primary.exception())
+
+                return primary.result()
+
+            self._hedges_in_flight += 1
+            hedge_path = path + HEDGE_FILE_SUFFIX
+            hedge = asyncio.create_task(self._fetch_slice_to(index, self._hedge_url(url) if self._hedge_url else url,
+                                                             hedge_path, report_failure=False))
+
+            winner, fetched, errors = None, None, {}
+            pending = {primary, hedge}
+
+            while pending and not winner:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    try:
+                        fetched = task.result()
+                    except Exception as e:
+                        # the other one may still be fine
+                        errors[task] = e
+                        continue
+
+                    if fetched:
+                        winner = task
+                        break
+        finally:
+            if hedge:
+                self._hedges_in_flight -= 1
 
-            return rets
+            # the loser has to stop writing before its file is touched
+            for task in (primary, hedge):
+                if task:
+                    task.cancel()
 
-    def _task_done_callback(self, task: Task) -> None:
-        """ task callback """
+            await asyncio.gather(*(task for task in (primary, hedge) if task), return_exceptions=True)
 
-        _name = task.get_name()
+        if winner is hedge:
+            os.replace(hedge_path, path)
+        elif os.path.isfile(hedge_path):
+            os.remove(hedge_path)
 
-        if task.result():
-            self._slices_done_count += 1
-            self._failure_tries_count = self._failure_tries_count - 1 if self._failure_tries_count > 0 else 0
+        if hedge in errors and not self._quiet:
+            # the hedge is only a loss, e.g. the slice may be missing from another origin
+            printy(f"the hedged request of slice {index} failed: {errors[hedge]}", flags="r>")
 
-            if self._progress_bar_display:
-                self._progress_bar.update(1)
+        if not winner and (error := errors.get(primary)):
+            self._on_hedged_error(index, error)
+            raise error
+
+        return fetched
+
+    def _on_hedged_error(self, index: int, error: Exception) -> None:
+        """ report the failure of a hedged slice, as `_fetch_slice_to` would have done on its own """
+
+        if not isinstance(error, InvalidSlice):
+            self._emit("on_segment_failed", index, str(error))
+
+    async def _restore_cached_slice(self, index: int) -> Optional[Tuple[int, int]]:
+        """ copy the slice out of the cache, return its size and crc32, `None` if it is not cached """
+
+        path = self._merge.slice_path(index)
+
+        # the default executor, the cache is shared by threads and can not be sent to a process
+        cached = await asyncio.get_running_loop().run_in_executor(None, self._cache.get, self._cache_key(index), path)
+        if not cached:
+            return None
+
+        size, checksum, data = cached
+        if path is None:
+            self._merge.keep(index, data)
+
+        return size, checksum
+
+    def _cache_key(self, index: int) -> str:
+        key, iv = None, None
+        if slice_key := self._slices.key(index):
+            key_url, iv = slice_key
+            key = self._decrypt_keys[key_url]
+
+        return self._cache.key(self._slices.url(index), self._slices.byterange(index), key, iv)
+
+    def _hedge_threshold(self) -> Optional[float]:
+        """ seconds after which a slice is a straggler, `None` before enough slices are done to tell """
+
+        if len(self._slice_durations) < HEDGE_MIN_SAMPLES:
+            return None
+
+        durations = sorted(self._slice_durations)
+        percentile = HEDGE_PERCENTILE if self._slices_queue.qsize() else HEDGE_DRAINED_PERCENTILE
+
+        return durations[min(int(len(durations) * percentile), len(durations) - 1)]
+
+    def _on_slice_failure(self, resp) -> None:
+        """
+        failed attempts of slice requests refused with 429/503, or without a response at all,
+        are the pushback signal of adaptive concurrency, other statuses are left to the retry policy
+        """
+
+        if resp is None:
+            self._adaptive.on_pushback()
+        elif resp.status in ADAPTIVE_PUSHBACK_STATUSES:
+            self._adaptive.on_pushback(retry_after(resp.headers))
+
+    async def _fetch_decrypt_keys(self, segments: list) -> None:
+        """ fetch every distinct key of the segments once """
+
+        for segment in segments:
+            if not (key_ := segment.key):
+                continue
+
+            if key_.method != "AES-128":
+                raise Exception("unresolved encryption method")
+
+            key_url = self._absolute_url(key_.uri)
+
+            if key_url not in self._decrypt_keys:
+                resp = await self._get(key_url)
+
+                if not resp or resp.status != 200:
+                    if resp:
+                        resp.release()
+                    raise Exception("unavailable encryption key url")
+
+                self._decrypt_keys[key_url] = await resp.read()
+
+    def _slices_append(self, segments: list) -> None:
+        """
+        add the segments to the slices table, the iv of a slice is either given by `EXT-X-KEY`
+        or derived from its media sequence number
+        """
+
+        for segment in segments:
+            key_url, iv = (self._absolute_url(segment.key.uri), segment.key.iv) if segment.key else (None, None)
+            self._slices.append(segment.uri, segment.byterange, key_url, iv, segment.sequence)
+
+    def _absolute_url(self, uri: str) -> str:
+        return urljoin(self._base_url, uri)
+
+    async def _get(
+        self, url: str, headers: Optional[Mapping[str, str]] = None, on_failure=None, defer_success: bool = False
+    ):
+        if headers:
+            headers = {**(self._headers or {}), **headers}
+
+        return await _get(self._session, url, self._retry_policy, on_failure, defer_success, params=self._params,
+                          cookies=self._cookies, headers=headers or self._headers, proxy=self._proxy)
+
+    async def _slices_urls_manager(self) -> None:
+        """ build up a queue that contain the indexes of all slices """
+
+        if not self._slices:
+            raise ValueError("slices must not be empty")
+
+        if self._resume:
+            # slices that landed in an earlier run are not fetched again, they are read through to be verified
+            merged, done = await asyncio.get_running_loop().run_in_executor(
+                None, self._manifest.restore, self._slices, self._merge.slice_path, self._merge.mid_object_path)
         else:
-            self._slices_urls_failure.append(_name)
+            merged, done = 0, []
+            if self._manifest:
+                self._manifest.reset(self._slices)
+
+        self._slices_total_num = len(self._slices)
+        self._slices_done_count = merged + len(done)
+
+        # lower indexes first, so that retried slices do not hold back the merging for long
+        self._slices_queue = asyncio.PriorityQueue()
+
+        self._merge.prepare(merged, self._manifest.merged if self._manifest else None)
+        for index in done:
+            self._merge.slice_done(index)
+
+        done = set(done)
+        for index in range(merged, len(self._slices)):
+            if index not in done:
+                self._slices_queue.put_nowait(index)
+                self._emit("on_segment_queued", index)
+
+    def _slices_urls_extend(self, segments: list) -> None:
+        """ queue new slices of a live stream """
+
+        start = len(self._slices)
+
+        self._merge.extend(len(segments))
+        self._slices_append(segments)
+        self._slices_total_num += len(segments)
+
+        for index in range(start, len(self._slices)):
+            self._slices_queue.put_nowait(index)
+            self._emit("on_segment_queued", index)
+
+        if self._progress_bar_display:
+            self._progress_bar.total = self._slices_total_num
+            self._progress_bar.refresh()
+
+
+def _range_header(first: int, stop: Optional[int]) -> dict:
+    return {"Range": f"bytes={first}-{stop - 1 if stop is not None else ''}"}
+
+
+def _content_range_stop(headers) -> Optional[int]:
+    """ size of the whole file by `Content-Range: bytes <first>-<last>/<size>`, `None` if unknown """
+
+    size = headers.get("Content-Range", '').rpartition('/')[2]
+
+    return int(size) if size.isdigit() else None
+
+
+def _split_range(first: int, stop: Optional[int], part_size: int) -> Iterator[Tuple[int, Optional[int]]]:
+    """ `[first, stop)` in parts of `part_size` bytes, a single open part if `stop` is unknown """
+
+    if stop is None:
+        return iter(((first, None),))
+
+    return ((part_first, min(part_first + part_size, stop)) for part_first in range(first, stop, part_size))
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from typing import Tuple
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+
+from .validate import InvalidSlice
+
+
+def split_batch(pending: bytearray, final: bool) -> Tuple[bytes, bytes]:
+    """
+    take the part of the pending ciphertext which can be decrypted now, and the iv of the part after it
+    the last block is always held back until the final batch since it may contain PKCS7 padding
+    """
+
+    size = len(pending) // AES.block_size * AES.block_size
+    if final:
+        size = len(pending)
+    elif size == len(pending):
+        size -= AES.block_size
+
+    if size <= 0:
+        return b'', b''
+
+    batch = bytes(pending[: size])
+    del pending[: size]
+
+    return batch, batch[-AES.block_size:]
+
+
+def decrypt_batch(key: bytes, iv: bytes, batch: bytes, final: bool) -> bytes:
+    """
+    decrypt a batch of a slice in AES-128 CBC mode
+    CBC carries nothing across blocks but the previous ciphertext block, which is the iv of the next batch,
+    so the batches of a slice are decrypted on their own, wherever they are
+    """
+
+    if final and len(batch) % AES.block_size:
+        # cut short on the way
+        raise InvalidSlice("encrypted slice is not aligned to AES block size")
+
+    plain = AES.new(key, AES.MODE_CBC, iv).decrypt(batch)
+
+    if not final:
+        return plain
+
+    try:
+        return unpad(plain, AES.block_size)
+    except ValueError:
+        # no valid padding, keep the bytes as they are
+        return plain
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import zlib
+
+from array import array
+
+from typing import (
+    Callable,
+    List,
+    Sequence,
+    Tuple
+)
+
+SLICE_DONE = "done"
+SLICE_MERGED = "merged"
+VERIFY_CHUNK_SIZE = 1024 * 1024
+
+# statuses of the slices in memory
+_NOT_RECORDED, _DONE, _MERGED = range(3)
+_STATUS_CODES = {SLICE_DONE: _DONE, SLICE_MERGED: _MERGED}
+_STATUS_NAMES = {_DONE: SLICE_DONE, _MERGED: SLICE_MERGED}
+
+
+class Manifest:
+    """
+    on-disk record of the slices that have landed, one json object per line
+    entries are appended as slices complete, so that an interrupted job can be resumed
+    in memory, the entries are arrays indexed by slice, the urls are looked up in `urls` when written out
+    """
+
+    __slots__ = (
+        "_path",
+        "_file",
+        "_urls",
+        "_sizes",
+        "_checksums",
+        "_statuses"
+    )
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._file = None
+        self._urls = None
+        self._sizes = array('Q')
+        self._checksums = array('L')
+        self._statuses = bytearray()
+
+    def restore(
+        self, urls: Sequence[str], slice_path: Callable[[int], str], merged_path: str
+    ) -> Tuple[int, List[int]]:
+        """
+        number of the slices that were appended to the concatenated file in order,
+        and indexes of the other recorded slices that are still intact on disk
+        """
+
+        self._allocate(urls)
+
+        if os.path.isfile(self._path):
+            with open(self._path, 'r') as manifest_file:
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line may be torn by an interrupted write
+                        continue
+
+                    # the slices of another playlist, or beyond the current one, are of no use
+                    if (index := entry["index"]) < len(urls) and _strip_query(entry["url"]) == _strip_query(urls[index]):
+                        self._sizes[index] = entry["size"]
+                        self._checksums[index] = entry["checksum"]
+                        self._statuses[index] = _STATUS_CODES[entry["status"]]
+                    elif index < len(urls):
+                        self._statuses[index] = _NOT_RECORDED
+
+        merged = 0
+
+        if os.path.isfile(merged_path):
+            merged_size = 0
+
+            with open(merged_path, 'r+b') as merged_file:
+                while (merged < len(urls) and self._statuses[merged] == _MERGED
+                       and _verify_region(merged_file, self._sizes[merged], self._checksums[merged])):
+                    merged_size += self._sizes[merged]
+                    merged += 1
+
+                # drop whatever was appended after the last recorded slice
+                merged_file.truncate(merged_size)
+
+        done = [
+            index for index in range(merged, len(urls))
+            if self._statuses[index] != _NOT_RECORDED
+            and _verify(slice_path(index), self._sizes[index], self._checksums[index])
+        ]
+
+        # start over with the verified entries only
+        self._statuses = bytearray(len(urls))
+        self._open()
+
+        for index in range(merged):
+            self._write(index, self._sizes[index], self._checksums[index], _MERGED)
+
+        for index in done:
+            self._write(index, self._sizes[index], self._checksums[index], _DONE)
+
+        return merged, done
+
+    def reset(self, urls: Sequence[str]) -> None:
+        self._allocate(urls)
+        self._open()
+
+    def record(self, index: int, size: int, checksum: int) -> None:
+        self._write(index, size, checksum, _DONE)
+
+    def merged(self, index: int) -> None:
+        """ the slice has been appended to the concatenated file, its own file is no longer needed """
+
+        self._write(index, self._sizes[index], self._checksums[index], _MERGED)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        self.close()
+
+        if os.path.isfile(self._path):
+            os.remove(self._path)
+
+    def _allocate(self, urls: Sequence[str]) -> None:
+        self._urls = urls
+        self._sizes = array('Q', bytes(len(urls) * self._sizes.itemsize))
+        self._checksums = array('L', bytes(len(urls) * self._checksums.itemsize))
+        self._statuses = bytearray(len(urls))
+
+    def _open(self) -> None:
+        self.close()
+        self._file = open(self._path, 'w')
+
+    def _write(self, index: int, size: int, checksum: int, status: int) -> None:
+        if index >= len(self._statuses):
+            # new slices of a live stream
+            grown = len(self._urls) - len(self._statuses)
+            self._sizes.frombytes(bytes(grown * self._sizes.itemsize))
+            self._checksums.frombytes(bytes(grown * self._checksums.itemsize))
+            self._statuses += bytes(grown)
+
+        self._sizes[index] = size
+        self._checksums[index] = checksum
+        self._statuses[index] = status
+
+        self._file.write(json.dumps({"index": index, "url": self._urls[index], "size": size, "checksum": checksum,
+                                     "status": _STATUS_NAMES[status]}) + '\n')
+        self._file.flush()
+
+
+def _strip_query(url: str) -> str:
+    # signed urls may carry a different token on every run
+    return url.split('?', 1)[0]
+
+
+def _verify(path: str, size: int, checksum: int) -> bool:
+    if not os.path.isfile(path) or os.path.getsize(path) != size:
+        return False
+
+    with open(path, 'rb') as slice_file:
+        return _verify_region(slice_file, size, checksum)
+
+
+def _verify_region(file, size: int, checksum: int) -> bool:
+    """ check the next `size` bytes from the current position of the file """
+
+    crc = 0
+    while size > 0:
+        chunk = file.read(min(size, VERIFY_CHUNK_SIZE))
+        if not chunk:
+            return False
+
+        crc = zlib.crc32(chunk, crc)
+        size -= len(chunk)
+
+    return crc == checksum
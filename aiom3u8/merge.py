@@ -1,81 +1,85 @@
 import os
-import re
+import sys
+import shutil
+import asyncio
 import subprocess
 
+from collections import deque
+from typing import (
+    Callable,
+    Optional,
+    Tuple
+)
 from printy import printy
 
+from .parse import Map
 from .params_def import (
-    CONCAT_FILE_CONTAINER,
-    CONCAT_FILE_TXT,
-    CONCAT_FILE_BAT,
     CONCAT_OBJECT_NAME,
-    FILE_SC
+    MERGE_BUFFER_SIZE
 )
 
 
-format_rules = {
-    "EXT-X-MAP": re.compile(r'#EXT-X-MAP:URI="(.*?)"(?:,BYTERANGE="(.*)")?')
-}
-
-
 class Merge:
     __slots__ = (
-        "_m3u8_content",
         "_init_mp4_required",
         "_init_mp4_uri",
         "_init_mp4_byterange",
         "_video_path",
+        "_scratch_path",
         "_video_name",
-        "_slices_path",
-        "_extra_clean_up_storage",
-        "is_slices_replace",
-        "slices_replace_reflection"
+        "_slices_num",
+        "_remux",
+        "_mid_object",
+        "_next_index",
+        "_done_indexes",
+        "_ready",
+        "_appender",
+        "_on_merged",
+        "_quiet",
+        "_trim",
+        "_renditions"
     )
 
     def __init__(
         self,
-        m3u8_content: str,
         video_path: str,
         video_name: str,
-        slices: list
+        slices_num: int,
+        remux: bool = True,
+        init_map: Optional[Map] = None,
+        scratch_path: Optional[str] = None,
+        quiet: bool = False,
+        trim: Optional[Tuple[float, Optional[float]]] = None
     ) -> None:
         self._init_mp4_required = False
         self._video_path = video_path
+        # slices and the concatenated file stay apart from the final video, in a directory of their own
+        self._scratch_path = scratch_path or video_path
         self._video_name = video_name
-        self._extra_clean_up_storage = []
+        self._remux = remux
+        self._mid_object = None
+        self._appender = None
+        self._quiet = quiet
+        # (offset, duration) in seconds to cut out of the concatenated stream
+        self._trim = trim
+        # (path, type, offset) of the concatenated alternate renditions, muxed into the video in the same ffmpeg run
+        self._renditions = []
 
         # figuring out the specific merging way
-        res = format_rules["EXT-X-MAP"].findall(m3u8_content)
-
-        if res:
+        if init_map:
             self._init_mp4_required = True
-            self._init_mp4_uri = res[0][0]
-            self._init_mp4_byterange = res[1][0] if len(res) == 2 else None
-
-            slices.insert(0, res[0][0])
-
-        # handle case that slice name contain the char cant be writen as file name
-        self.is_slices_replace = False
-        for slice_ in slices:
-            _ = slice_[slice_.rfind('/') + 1:] if slice_.startswith("http") or slice_[0] == '/' else slice_
-            if any([_.find(ch) != -1 for ch in FILE_SC]):
-                self.is_slices_replace = True
-
-            if self.is_slices_replace:
-                break
-
-        if self.is_slices_replace:
-            self.slices_replace_reflection = {}
-            self._slices_path = []
-
-            for index, slice_ in enumerate(slices):
-                new_file_name = str(index) + (".ts" if slice_.endswith(".ts") else '')
-                self.slices_replace_reflection.update(
-                    {slice_: new_file_name}
-                )
-                self._slices_path.append(os.path.join(self._video_path, new_file_name))
-        else:
-            self._slices_path = [os.path.join(self._video_path, slice_[slice_.rfind('/') + 1:]) for slice_ in slices]
+            self._init_mp4_uri = init_map.uri
+            self._init_mp4_byterange = init_map.byterange
+
+            # the init video goes ahead of the media slices
+            slices_num += 1
+
+        self._slices_num = slices_num
+
+    def extend(self, slices_num: int) -> None:
+        """ more slices appended to the slices list, e.g. new slices of a live stream """
+
+        self._slices_num += slices_num
 
     @property
     def pre_uri(self):
@@ -86,127 +90,214 @@ class Merge:
         else:
             return None
 
-    def start(self):
-        printy("Merging... (It may take for a while)", flags="r>")
+    def slice_path(self, index: int) -> str:
+        """
+        local path of the slice, in the same order as the slices list,
+        named by the index, as the names of slices may be anything, or the same for the byte ranges of a file
+        """
 
-        if self._init_mp4_required:
-            self._process_type_x_map()
-        else:
-            self._process_type_default()
+        return os.path.join(self._scratch_path, str(index))
 
-        self._clean_up_residues()
+    def add_rendition(self, path: str, media_type: str, offset: float = 0.) -> None:
+        """
+        an alternate rendition of `EXT-X-MEDIA` which has been concatenated on its own,
+        starting `offset` seconds after the video, as the slices of a partial download do not line up
+        """
 
-        printy("DONE", flags="r>")
+        self._renditions.append((path, media_type, offset))
+
+    @property
+    def mid_object_path(self) -> str:
+        return os.path.join(self._scratch_path, CONCAT_OBJECT_NAME)
 
-    def _process_type_x_map(self) -> None:
+    def prepare(self, merged: int, on_merged: Callable[[int], None]) -> None:
         """
-        merge slices in `EXT-X-MAP` way
-        1. Combine all the M4S files that comprise a single streamed video into one M4S file.
-        2. Convert the combined M4S file into an .MP4 file.
+        open the concatenated file, whose first `merged` slices have been appended in an earlier run
+        `on_merged` is called for every slice once it is appended, right before its own file is removed
         """
 
-        # make sure the init video has been downloaded
-        init_video_exist = False
+        self._next_index = merged
+        self._done_indexes = set()
+        # slices in order to be appended by `_append_ready`
+        self._ready = deque()
+        self._on_merged = on_merged
+        self._mid_object = open(self.mid_object_path, 'ab' if merged else 'wb', buffering=0)
 
-        for _ in os.listdir(self._video_path):
-            if _.find(".mp4") != -1:
-                init_video_exist = True
-                break
+    def slice_done(self, index: int) -> None:
+        """
+        append the slices to the concatenated file as soon as they form a contiguous prefix,
+        the ones arrived out of order wait in the reorder buffer
+        the order is settled here, the appending itself is left to the default executor, see `flush`
+        """
 
-        if not init_video_exist:
-            raise Exception("can not merge slices without init video")
+        self._done_indexes.add(index)
 
-        # build up .bat file to create concatenated file
-        concat_file_txt_path = os.path.join(self._video_path, CONCAT_FILE_TXT)
-        concat_file_bat_path = os.path.join(self._video_path, CONCAT_FILE_BAT)
-        mid_object_path = os.path.join(self._video_path, CONCAT_OBJECT_NAME)
-        final_video_path = os.path.join(self._video_path, self._video_name)
+        while self._next_index in self._done_indexes:
+            self._done_indexes.remove(self._next_index)
+            self._ready.append(self._next_index)
+            self._next_index += 1
 
-        with open(concat_file_txt_path, 'w') as concat_bat_file:
-            for index, slice_path in enumerate(self._slices_path):
-                if not index:
-                    concat_bat_file.write(f'type "{slice_path}" >"{mid_object_path}"\n')
-                else:
-                    concat_bat_file.write(f'type "{slice_path}" >>"{mid_object_path}"\n')
+        # an appender that has failed is not replaced, its error is raised by `flush`
+        if self._ready and (self._appender is None or (self._appender.done() and not self._appender.exception())):
+            self._appender = asyncio.create_task(self._append_ready())
 
-            concat_bat_file.write("exit")
+    async def flush(self) -> None:
+        """ wait until the slices done so far have been appended """
 
-        os.rename(concat_file_txt_path, concat_file_bat_path)
-        proc = subprocess.Popen(
-            concat_file_bat_path,
-            cwd=self._video_path,
-            stdout=subprocess.PIPE
-        )
-        proc.communicate()
+        if self._appender:
+            await self._appender
 
-        # convert concatenated file to final video that can be viewed
-        proc = subprocess.Popen(
-            f"ffmpeg.exe -y -i {mid_object_path} -c copy {final_video_path}",
-            cwd=os.path.abspath(os.path.dirname(__file__)),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True
-        )
-        proc.communicate()
+    async def _append_ready(self) -> None:
+        loop = asyncio.get_running_loop()
 
-    def _process_type_default(self) -> None:
-        """
-        merge slices in default way
-        Combine all the slices with ffmpeg concat instruction
-        """
-        _tgt_slices_path = [slice_path + ".ts" if not slice_path.endswith(".ts") else slice_path
-                            for slice_path in self._slices_path]
+        while self._ready:
+            slice_path = self.slice_path(self._ready[0])
+            await loop.run_in_executor(None, _append_file, self._mid_object, slice_path)
 
-        cwd_ = os.path.abspath(os.path.dirname(__file__))
+            self._on_merged(self._ready.popleft())
+            await loop.run_in_executor(None, os.remove, slice_path)
 
-        for index, _path in enumerate(_tgt_slices_path):
-            _slice_path = self._slices_path[index]
+    def close(self) -> None:
+        if self._mid_object:
+            self._mid_object.close()
+            self._mid_object = None
 
-            if not _slice_path.endswith(".ts"):
-                subprocess.Popen(
-                    f"ffmpeg.exe -y -f mpegts -i {_slice_path} -c copy {_path}",
-                    cwd=cwd_,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    shell=True
-                ).communicate()
+    def start(self):
+        self._print("Merging... (It may take for a while)")
+
+        if self._next_index != self._slices_num:
+            raise Exception("can not merge slices, part of them are missing")
 
-        self._extra_clean_up_storage += _tgt_slices_path
+        self.close()
 
-        concat_file_container_path = os.path.join(self._video_path, CONCAT_FILE_CONTAINER)
         final_video_path = os.path.join(self._video_path, self._video_name)
 
-        with open(concat_file_container_path, 'w') as concat_bat_file:
-            for index, slice_path in enumerate(_tgt_slices_path):
-                concat_bat_file.write(f"file '{slice_path}'\n")
+        for path, media_type, _ in self._renditions:
+            if media_type == "SUBTITLES":
+                _join_webvtt(path)
+
+        if not self._remux or not self._remux_to(self.mid_object_path, final_video_path):
+            os.replace(self.mid_object_path, final_video_path)
 
-        proc = subprocess.Popen(
-            f"ffmpeg.exe -y -safe 0 -f concat -i {concat_file_container_path} -c copy {final_video_path}",
-            cwd=cwd_,
+            # only ffmpeg can mux them, the renditions are kept beside the video instead
+            for path, _, _ in self._renditions:
+                os.replace(path, os.path.join(self._video_path, os.path.basename(path)))
+
+        self._clean_up_residues()
+
+        self._print("DONE")
+
+    def _remux_to(self, mid_object_path: str, final_video_path: str) -> bool:
+        """ convert concatenated file to final video container with a single ffmpeg run """
+
+        ffmpeg = shutil.which("ffmpeg", path=os.pathsep.join(
+            [os.path.abspath(os.path.dirname(__file__)), os.environ.get("PATH", '')]
+        ))
+
+        if not ffmpeg:
+            self._print("ffmpeg is not found, the concatenated stream is kept without remuxing"
+                        + (" or trimming" if self._trim else ''))
+            return False
+
+        args = [ffmpeg, "-y", "-i", mid_object_path]
+
+        for path, _, offset in self._renditions:
+            # every input starts at 0, the renditions are put back in place against the video
+            if offset:
+                args += ["-itsoffset", f"{offset:.3f}"]
+            args += ["-i", path]
+
+        if self._renditions:
+            # every stream of every input, rather than the single best one of each kind
+            for index in range(len(self._renditions) + 1):
+                args += ["-map", str(index)]
+
+        if self._trim:
+            # cutting exactly where asked for takes decoding, so the streams are re-encoded instead of copied
+            offset, duration = self._trim
+            args += ["-ss", f"{offset:.3f}"]
+            if duration is not None:
+                args += ["-t", f"{duration:.3f}"]
+        else:
+            args += ["-c", "copy"]
+
+            if (any(media_type == "SUBTITLES" for _, media_type, _ in self._renditions)
+                    and os.path.splitext(final_video_path)[1].lower() in (".mp4", ".m4v", ".mov")):
+                # WebVTT can not be copied into an mp4 container
+                args += ["-c:s", "mov_text"]
+
+        proc = subprocess.run(
+            args + [final_video_path],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True
+            stderr=subprocess.PIPE
         )
-        proc.communicate()
+
+        if proc.returncode:
+            self._print("ffmpeg failed to remux, the concatenated stream is kept")
+            return False
+
+        return True
+
+    def _print(self, message: str) -> None:
+        if not self._quiet:
+            printy(message, flags="r>")
 
     def _clean_up_residues(self) -> None:
-        for _ in self._slices_path + self._extra_clean_up_storage:
-            if os.path.isfile(_):
-                os.remove(_)
+        for index in range(self._slices_num):
+            if os.path.isfile(slice_path := self.slice_path(index)):
+                os.remove(slice_path)
 
-        if self._init_mp4_required:
-            # remove .bat file and concatenated file
-            concat_file_bat_path = os.path.join(self._video_path, CONCAT_FILE_BAT)
-            mid_object_path = os.path.join(self._video_path, CONCAT_OBJECT_NAME)
+        # remove concatenated file
+        if os.path.isfile(self.mid_object_path):
+            os.remove(self.mid_object_path)
 
-            if os.path.isfile(concat_file_bat_path):
-                os.remove(concat_file_bat_path)
+        if self._scratch_path != self._video_path:
+            shutil.rmtree(self._scratch_path, ignore_errors=True)
 
-            if os.path.isfile(mid_object_path):
-                os.remove(mid_object_path)
-        else:
-            # remove .txt file
-            concat_file_container_path = os.path.join(self._video_path, CONCAT_FILE_CONTAINER)
 
-            if os.path.isfile(concat_file_container_path):
-                os.remove(concat_file_container_path)
+def _join_webvtt(path: str) -> None:
+    """ every segment of a WebVTT rendition starts with a header of its own, only the first one is kept """
+
+    with open(path, 'r', encoding="utf-8", errors="replace") as vtt_file:
+        lines = vtt_file.read().splitlines()
+
+    joined = []
+    header_seen = False
+    in_header = False
+
+    for line in lines:
+        if line.lstrip('\ufeff').startswith("WEBVTT"):
+            in_header = header_seen
+            header_seen = True
+        elif in_header:
+            # the header block ends at the first blank line
+            in_header = bool(line.strip())
+
+        if not in_header:
+            joined.append(line)
+
+    with open(path, 'w', encoding="utf-8") as vtt_file:
+        vtt_file.write('\n'.join(joined) + '\n')
+
+
+def _append_file(dst_file, src_path: str) -> None:
+    """ append a whole file to an unbuffered one, in kernel space where it is supported """
+
+    with open(src_path, 'rb') as src_file:
+        size = os.fstat(src_file.fileno()).st_size
+        offset = 0
+
+        if sys.platform.startswith("linux"):
+            try:
+                while offset < size:
+                    sent = os.sendfile(dst_file.fileno(), src_file.fileno(), offset, size - offset)
+                    if not sent:
+                        break
+
+                    offset += sent
+            except OSError:
+                pass
+
+        if offset < size:
+            src_file.seek(offset)
+            shutil.copyfileobj(src_file, dst_file, MERGE_BUFFER_SIZE)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import bisect
+
+from typing import Sequence
+
+from .params_def import (
+    METRICS_PREFIX,
+    METRICS_LATENCY_BUCKETS,
+    METRICS_DURATION_BUCKETS,
+    METRICS_THROUGHPUT_BUCKETS
+)
+
+
+class JobSummary:
+    """ what a finished job has done, handed to `Observer.on_job_finished` """
+
+    __slots__ = (
+        "video_name",
+        "segments",
+        "bytes",
+        "retries",
+        "download_elapsed",
+        "merge_elapsed"
+    )
+
+    def __init__(
+        self, video_name: str, segments: int, bytes_: int, retries: int, download_elapsed: float, merge_elapsed: float
+    ) -> None:
+        self.video_name = video_name
+        self.segments = segments
+        # bytes downloaded by this run, the slices restored from an earlier run are not counted
+        self.bytes = bytes_
+        self.retries = retries
+        self.download_elapsed = download_elapsed
+        self.merge_elapsed = merge_elapsed
+
+    @property
+    def throughput(self) -> float:
+        """ bytes per second while downloading """
+
+        return self.bytes / self.download_elapsed if self.download_elapsed > 0 else 0.
+
+
+class Observer:
+    """
+    hooks into a download job, every one of them does nothing by default
+    `job` is the name of the video, `index` the position of the slice in the slices list,
+    every started slice ends up either completed, retried or failed
+    """
+
+    __slots__ = ()
+
+    def on_segment_queued(self, job: str, index: int) -> None:
+        pass
+
+    def on_segment_started(self, job: str, index: int) -> None:
+        pass
+
+    def on_segment_first_byte(self, job: str, index: int, latency: float) -> None:
+        pass
+
+    def on_segment_bytes(self, job: str, index: int, size: int) -> None:
+        pass
+
+    def on_segment_completed(self, job: str, index: int, size: int, elapsed: float) -> None:
+        pass
+
+    def on_segment_retried(self, job: str, index: int, attempt: int) -> None:
+        pass
+
+    def on_segment_failed(self, job: str, index: int, reason: str) -> None:
+        pass
+
+    def on_segment_digest(self, job: str, index: int, digest: str) -> None:
+        """ hex digest of the slice as it has been received, with `hash_algorithm` """
+
+        pass
+
+    def on_job_finished(self, job: str, summary: JobSummary) -> None:
+        pass
+
+
+class _Histogram:
+    __slots__ = (
+        "buckets",
+        "counts",
+        "sum",
+        "count"
+    )
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def expose(self, name: str) -> list:
+        lines = [f"# TYPE {name} histogram"]
+        cumulative = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+
+        return lines
+
+
+class MetricsCollector(Observer):
+    """
+    in-process collector of all the jobs it observes, `expose` renders it in the OpenMetrics text format
+    """
+
+    __slots__ = (
+        "_prefix",
+        "_counters",
+        "_in_flight",
+        "_first_byte",
+        "_segment_duration",
+        "_merge_duration",
+        "_job_throughput"
+    )
+
+    def __init__(
+        self,
+        prefix: str = METRICS_PREFIX,
+        latency_buckets: Sequence[float] = METRICS_LATENCY_BUCKETS,
+        duration_buckets: Sequence[float] = METRICS_DURATION_BUCKETS
+    ) -> None:
+        self._prefix = prefix
+        self._counters = dict.fromkeys(("segments_queued", "segments_completed", "segments_retried",
+                                        "segments_failed", "bytes_downloaded", "jobs_finished"), 0)
+        self._in_flight = 0
+
+        self._first_byte = _Histogram(latency_buckets)
+        self._segment_duration = _Histogram(latency_buckets)
+        self._merge_duration = _Histogram(duration_buckets)
+        self._job_throughput = _Histogram(METRICS_THROUGHPUT_BUCKETS)
+
+    def on_segment_queued(self, job: str, index: int) -> None:
+        self._counters["segments_queued"] += 1
+
+    def on_segment_started(self, job: str, index: int) -> None:
+        self._in_flight += 1
+
+    def on_segment_first_byte(self, job: str, index: int, latency: float) -> None:
+        self._first_byte.observe(latency)
+
+    def on_segment_bytes(self, job: str, index: int, size: int) -> None:
+        self._counters["bytes_downloaded"] += size
+
+    def on_segment_completed(self, job: str, index: int, size: int, elapsed: float) -> None:
+        self._in_flight -= 1
+        self._counters["segments_completed"] += 1
+        self._segment_duration.observe(elapsed)
+
+    def on_segment_retried(self, job: str, index: int, attempt: int) -> None:
+        self._in_flight -= 1
+        self._counters["segments_retried"] += 1
+
+    def on_segment_failed(self, job: str, index: int, reason: str) -> None:
+        self._in_flight -= 1
+        self._counters["segments_failed"] += 1
+
+    def on_job_finished(self, job: str, summary: JobSummary) -> None:
+        self._counters["jobs_finished"] += 1
+        self._merge_duration.observe(summary.merge_elapsed)
+        self._job_throughput.observe(summary.throughput)
+
+    def expose(self) -> str:
+        lines = []
+
+        for name, value in self._counters.items():
+            lines.append(f"# TYPE {self._prefix}_{name} counter")
+            lines.append(f"{self._prefix}_{name}_total {value}")
+
+        lines.append(f"# TYPE {self._prefix}_segments_in_flight gauge")
+        lines.append(f"{self._prefix}_segments_in_flight {self._in_flight}")
+
+        lines += self._first_byte.expose(f"{self._prefix}_segment_first_byte_seconds")
+        lines += self._segment_duration.expose(f"{self._prefix}_segment_duration_seconds")
+        lines += self._merge_duration.expose(f"{self._prefix}_merge_duration_seconds")
+        lines += self._job_throughput.expose(f"{self._prefix}_job_throughput_bytes_per_second")
+
+        lines.append("# EOF")
+
+        return "\n".join(lines) + "\n"
@@ -2,18 +2,90 @@
 
 # SIGNAL
 EXIT_MIDWAY = 1
-MAIN_ASYNC_TASK_SYMBOL = 1
 
 # DEFAULT ARGUMENTS
 ASYNC_TASKS_MAINTAIN = -1
-INSPECT_INTERVAL = 2.
+# workers of a job when `async_tasks_maintain` is not given, bounded by the connection pool as well
+WORKERS_MAINTAIN = 100
 FETCH_FAILURE_TRIES = 10
 
+# CONNECTION POOL
+CONNECTOR_LIMIT = 100
+CONNECTOR_LIMIT_PER_HOST = 0
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30.
+
+# ADAPTIVE CONCURRENCY
+ADAPTIVE_MAX_WINDOW = 64
+ADAPTIVE_INITIAL_WINDOW = 4
+ADAPTIVE_LATENCY_SAMPLES = 256
+ADAPTIVE_LATENCY_INFLATION = 3.
+ADAPTIVE_THROUGHPUT_TOLERANCE = .9
+ADAPTIVE_DECREASE_FACTOR = .75
+ADAPTIVE_BACKOFF_FACTOR = .5
+# statuses by which the server asks for less, other retryable ones are only retried
+ADAPTIVE_PUSHBACK_STATUSES = (429, 503)
+
+# RETRY POLICY
+RETRY_BACKOFF_BASE = .5
+RETRY_BACKOFF_MAX = 30.
+RETRY_ATTEMPT_TIMEOUT = 30.
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN = 10.
+
+# METRICS
+METRICS_PREFIX = "aiom3u8"
+METRICS_LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+METRICS_DURATION_BUCKETS = (.1, .5, 1., 5., 10., 30., 60., 300.)
+METRICS_THROUGHPUT_BUCKETS = (1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8, 1e9)
+
+# BANDWIDTH LIMITING
+BANDWIDTH_BURST_SECONDS = 1.
+BANDWIDTH_RECHECK_INTERVAL = .1
+
+# HEDGED REQUESTS
+HEDGE_PERCENTILE = .95
+HEDGE_DRAINED_PERCENTILE = .5
+HEDGE_MIN_SAMPLES = 10
+HEDGE_SAMPLES = 256
+HEDGE_MAX_IN_FLIGHT = 4
+HEDGE_RECHECK_INTERVAL = .25
+
+# SCHEDULER
+SCHEDULER_MAX_IN_FLIGHT = 100
+
+# STREAMING
+STREAM_CHUNK_SIZE = 64 * 1024
+OFFLOAD_BUFFER_SIZE = 1024 * 1024
+STREAM_READ_AHEAD = 8
+
+# ALTERNATE RENDITIONS
+RENDITION_TYPES = ("AUDIO", "SUBTITLES")
+
+# BYTE RANGES
+RANGE_COALESCE_MAX = 4 * 1024 * 1024
+RANGE_SPLIT_PARALLEL = 4
+
+# VARIANT SELECTION
+VARIANT_PROBE_SEGMENTS = 2
+
+# SEGMENT CACHE
+CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+CACHE_EVICT_RATIO = .9
+
+# LIVE
+LIVE_DEFAULT_TARGET_DURATION = 10
+
+# MERGING
+MERGE_BUFFER_SIZE = 1024 * 1024
+
 # OUT FILES
-CONCAT_FILE_CONTAINER = "CONCAT.txt"
-CONCAT_FILE_TXT = "CONCATENAR.txt"
-CONCAT_FILE_BAT = "CONCATENAR.bat"
 CONCAT_OBJECT_NAME = "VIDEO"
+MANIFEST_FILE = "MANIFEST.jsonl"
+SCRATCH_DIR_SUFFIX = ".parts"
+HEDGE_FILE_SUFFIX = ".hedge"
+CACHE_FILE_SUFFIX = ".seg"
 
 # SPECIAL CHARACTERS
 FILE_SC = '\\/:*?"<>|'
@@ -1,28 +1,323 @@
 # -*- coding: utf-8 -*-
 import re
 
+from typing import (
+    Optional,
+    Tuple
+)
+
 format_rules = {
-    "URL_HOST": re.compile(r"^https?://.*?/"),
-    "URL_PREFIX": re.compile(r"^https?://.*/"),
-    "MULTI_RATE": re.compile(r"BANDWIDTH=(\d*).*\n(.*\.m3u8.*)"),
-    "MEDIA_SEQ": re.compile(r"#EXTINF:.*,\n(.*)\n"),
-    "CRYPT_KEY": re.compile(r'#EXT-X-KEY:METHOD=(.*),URI="(.*)"\n')
+    "URL": re.compile(r"^https?://[^/]+"),
+    "ATTRIBUTES": re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
 }
 
 
+class Key:
+    """ `EXT-X-KEY`, shared by all the segments it applies to """
+
+    __slots__ = (
+        "method",
+        "uri",
+        "iv"
+    )
+
+    def __init__(self, method: str, uri: Optional[str], iv: Optional[bytes]) -> None:
+        self.method = method
+        self.uri = uri
+        self.iv = iv
+
+
+class Map:
+    """ `EXT-X-MAP`, the init section shared by all the segments it applies to """
+
+    __slots__ = (
+        "uri",
+        "byterange"
+    )
+
+    def __init__(self, uri: str, byterange: Optional[Tuple[int, int]]) -> None:
+        self.uri = uri
+        self.byterange = byterange
+
+
+class Segment:
+    __slots__ = (
+        "uri",
+        "duration",
+        "title",
+        "sequence",
+        "byterange",
+        "key",
+        "map",
+        "discontinuity"
+    )
+
+    def __init__(
+        self,
+        uri: str,
+        duration: float,
+        title: str,
+        sequence: int,
+        byterange: Optional[Tuple[int, int]],
+        key: Optional[Key],
+        map_: Optional[Map],
+        discontinuity: bool
+    ) -> None:
+        self.uri = uri
+        self.duration = duration
+        self.title = title
+        self.sequence = sequence
+        # (length, offset)
+        self.byterange = byterange
+        self.key = key
+        self.map = map_
+        self.discontinuity = discontinuity
+
+
+class Variant:
+    """ `EXT-X-STREAM-INF` with all of its attributes """
+
+    __slots__ = (
+        "uri",
+        "attributes"
+    )
+
+    def __init__(self, uri: str, attributes: dict) -> None:
+        self.uri = uri
+        self.attributes = attributes
+
+    @property
+    def bandwidth(self) -> int:
+        return int(self.attributes.get("BANDWIDTH", 0))
+
+    @property
+    def resolution(self) -> Optional[Tuple[int, int]]:
+        if resolution := self.attributes.get("RESOLUTION"):
+            width, _, height = resolution.partition('x')
+            return int(width), int(height)
+
+        return None
+
+    @property
+    def codecs(self) -> Optional[str]:
+        return self.attributes.get("CODECS")
+
+
+class Media:
+    """ `EXT-X-MEDIA` with all of its attributes """
+
+    __slots__ = (
+        "attributes",
+    )
+
+    def __init__(self, attributes: dict) -> None:
+        self.attributes = attributes
+
+    @property
+    def type(self) -> Optional[str]:
+        return self.attributes.get("TYPE")
+
+    @property
+    def group_id(self) -> Optional[str]:
+        return self.attributes.get("GROUP-ID")
+
+    @property
+    def uri(self) -> Optional[str]:
+        return self.attributes.get("URI")
+
+    @property
+    def default(self) -> bool:
+        return self.attributes.get("DEFAULT") == "YES"
+
+
+class Playlist:
+    """ master playlist has `variants` (and `media`), media playlist has `segments` """
+
+    __slots__ = (
+        "variants",
+        "media",
+        "segments",
+        "media_sequence",
+        "discontinuity_sequence",
+        "target_duration",
+        "playlist_type",
+        "end_list"
+    )
+
+    def __init__(self) -> None:
+        self.variants = []
+        self.media = []
+        self.segments = []
+        self.media_sequence = 0
+        self.discontinuity_sequence = 0
+        self.target_duration = 0
+        self.playlist_type = None
+        self.end_list = False
+
+
 class Parse:
     @staticmethod
-    def fetch_multi_rate_adaptation(file_content):
-        return format_rules["MULTI_RATE"].findall(file_content)
+    def playlist(file_content: str) -> Playlist:
+        """ tokenize the playlist line by line in a single pass """
+
+        playlist = Playlist()
+        segments = playlist.segments
+
+        duration = None
+        title = ''
+        byterange = None
+        key = None
+        map_ = None
+        discontinuity = False
+        variant_attributes = None
+
+        # where the next byterange starts by default, for each uri
+        byterange_ends = {}
+
+        for line in file_content.splitlines():
+            line = line.strip()
+
+            if not line:
+                continue
+
+            if line[0] != '#':
+                if duration is not None:
+                    if byterange:
+                        length, offset = byterange
+                        if offset is None:
+                            offset = byterange_ends.get(line, 0)
+
+                        byterange = (length, offset)
+                        byterange_ends[line] = offset + length
+
+                    segments.append(Segment(line, duration, title, playlist.media_sequence + len(segments),
+                                            byterange, key, map_, discontinuity))
+
+                    duration = None
+                    byterange = None
+                    discontinuity = False
+                elif variant_attributes is not None:
+                    playlist.variants.append(Variant(line, variant_attributes))
+                    variant_attributes = None
+
+                continue
+
+            tag, _, value = line.partition(':')
+
+            if tag == "#EXTINF":
+                duration, _, title = value.partition(',')
+                duration = float(duration or 0)
+            elif tag == "#EXT-X-BYTERANGE":
+                byterange = Parse._byterange(value)
+            elif tag == "#EXT-X-KEY":
+                attributes = Parse.attributes(value)
+                method = attributes.get("METHOD", "NONE")
+
+                if method == "NONE":
+                    key = None
+                else:
+                    iv = attributes.get("IV")
+                    key = Key(method, attributes.get("URI"), Parse._iv(iv) if iv else None)
+            elif tag == "#EXT-X-MAP":
+                attributes = Parse.attributes(value)
+                map_byterange = None
+
+                if "BYTERANGE" in attributes:
+                    # the range of an init section starts at 0 unless told otherwise
+                    length, offset = Parse._byterange(attributes["BYTERANGE"])
+                    map_byterange = (length, offset or 0)
+
+                map_ = Map(attributes.get("URI"), map_byterange)
+            elif tag == "#EXT-X-DISCONTINUITY":
+                discontinuity = True
+            elif tag == "#EXT-X-STREAM-INF":
+                variant_attributes = Parse.attributes(value)
+            elif tag == "#EXT-X-MEDIA":
+                playlist.media.append(Media(Parse.attributes(value)))
+            elif tag == "#EXT-X-MEDIA-SEQUENCE":
+                playlist.media_sequence = int(value)
+            elif tag == "#EXT-X-DISCONTINUITY-SEQUENCE":
+                playlist.discontinuity_sequence = int(value)
+            elif tag == "#EXT-X-TARGETDURATION":
+                playlist.target_duration = int(float(value))
+            elif tag == "#EXT-X-PLAYLIST-TYPE":
+                playlist.playlist_type = value
+            elif tag == "#EXT-X-ENDLIST":
+                playlist.end_list = True
+
+        return playlist
+
+    @staticmethod
+    def time_range(
+        segments: list, start_time: Optional[float], end_time: Optional[float]
+    ) -> Tuple[int, int, float]:
+        """
+        indexes `[first, last)` of the segments covering `[start_time, end_time)` by their cumulative `EXTINF`
+        durations, and the offset of `start_time` into the first one of them
+        """
+
+        first, last = None, len(segments)
+        position = 0.
+        offset = 0.
+
+        for index, segment in enumerate(segments):
+            if first is None and (start_time is None or position + segment.duration > start_time):
+                first = index
+                offset = start_time - position if start_time else 0.
+
+            if end_time is not None and position >= end_time:
+                last = index
+                break
+
+            position += segment.duration
+
+        if first is None or first >= last:
+            raise ValueError("the time range is out of the playlist")
+
+        return first, last, offset
+
+    @staticmethod
+    def coalesce_ranges(segments: list, max_length: int) -> list:
+        """
+        join the byte ranges of a file which follow one another into segments of up to `max_length` bytes,
+        so that they are fetched by one request, encrypted segments are left alone as each one is padded on its own
+        """
+
+        coalesced = []
+
+        for segment in segments:
+            previous = coalesced[-1] if coalesced else None
+
+            if (previous and previous.byterange and segment.byterange
+                    and not previous.key and not segment.key
+                    and previous.uri == segment.uri and previous.map is segment.map
+                    and sum(previous.byterange) == segment.byterange[1]
+                    and previous.byterange[0] + segment.byterange[0] <= max_length):
+                coalesced[-1] = Segment(previous.uri, previous.duration + segment.duration, previous.title,
+                                        previous.sequence, (previous.byterange[0] + segment.byterange[0],
+                                                            previous.byterange[1]),
+                                        None, previous.map, previous.discontinuity)
+            else:
+                coalesced.append(segment)
+
+        return coalesced
+
+    @staticmethod
+    def is_url(url):
+        return bool(format_rules["URL"].match(url))
 
     @staticmethod
-    def fetch_media_sequential_slices(file_content):
-        return format_rules["MEDIA_SEQ"].findall(file_content)
+    def attributes(attribute_list):
+        return {name: value.strip('"') for name, value in format_rules["ATTRIBUTES"].findall(attribute_list)}
 
     @staticmethod
-    def url(url):
-        return format_rules["URL_HOST"].findall(url), format_rules["URL_PREFIX"].findall(url)
+    def _byterange(value: str) -> Tuple[int, Optional[int]]:
+        """ `<n>[@<o>]`, offset is `None` when it follows the previous range """
+
+        length, _, offset = value.strip('"').partition('@')
+        return int(length), int(offset) if offset else None
 
     @staticmethod
-    def key(file_content):
-        return format_rules["CRYPT_KEY"].findall(file_content)
+    def _iv(value: str) -> bytes:
+        # short ones, of an odd number of digits as well, are padded with leading zeros
+        return int(value, 16).to_bytes(16, "big")
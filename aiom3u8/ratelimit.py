@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+
+from typing import Optional
+
+from .params_def import (
+    BANDWIDTH_BURST_SECONDS,
+    BANDWIDTH_RECHECK_INTERVAL
+)
+
+
+class TokenBucket:
+    """
+    limit a byte rate, `rate` bytes per second with bursts of up to `burst` bytes
+    a consumer that can not be paid at once runs into debt and waits until its own bytes are paid off,
+    so consumers are served in the order they came, and chunks larger than the burst are fine
+    `rate` may be changed at any time, waiting consumers pick it up too, `None` lifts the limit
+    """
+
+    __slots__ = (
+        "_rate",
+        "_burst",
+        "_owed",
+        "_paid",
+        "_updated_at"
+    )
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None) -> None:
+        self._rate = rate
+        self._burst = burst
+        # bytes consumed and bytes paid for so far, the difference is the debt (or the tokens left if negative)
+        self._owed = 0.
+        self._paid = self.burst
+        self._updated_at = None
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: Optional[float]) -> None:
+        # the tokens earned so far are earned at the old rate
+        self._refill()
+        self._rate = rate
+
+    @property
+    def burst(self) -> float:
+        if self._burst is not None:
+            return self._burst
+
+        return (self._rate or 0) * BANDWIDTH_BURST_SECONDS
+
+    async def consume(self, size: int) -> None:
+        if not self._rate:
+            return
+
+        self._refill()
+        self._owed += size
+        target = self._owed
+
+        while self._rate and self._paid < target:
+            # woken up now and then, so that a new rate applies to the consumers already waiting
+            await asyncio.sleep(min((target - self._paid) / self._rate, BANDWIDTH_RECHECK_INTERVAL))
+            self._refill()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+
+        if self._updated_at is not None and self._rate:
+            self._paid = min(self._paid + (now - self._updated_at) * self._rate, self._owed + self.burst)
+
+        self._updated_at = now
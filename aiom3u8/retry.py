@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import random
+import asyncio
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from typing import (
+    Optional,
+    Mapping,
+    Iterable
+)
+
+from .params_def import (
+    FETCH_FAILURE_TRIES,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    RETRY_ATTEMPT_TIMEOUT,
+    RETRYABLE_STATUSES,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_COOLDOWN
+)
+
+
+class CircuitBreaker:
+    """
+    stop sending requests to an origin after a run of failures,
+    once the cooldown has passed a single probe request decides whether it is closed again or stays open
+    """
+
+    __slots__ = (
+        "_threshold",
+        "_cooldown",
+        "_failures",
+        "_opened_at",
+        "_probing"
+    )
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN) -> None:
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    async def acquire(self) -> bool:
+        """ wait until a request may be sent, `True` if it is the probe of a half-open breaker """
+
+        loop = asyncio.get_running_loop()
+
+        while self._opened_at is not None:
+            if (delay := self._opened_at + self._cooldown - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            elif not self._probing:
+                self._probing = True
+                return True
+            else:
+                # the probe is in flight
+                await asyncio.sleep(min(self._cooldown, 1.))
+
+        return False
+
+    def success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def failure(self) -> None:
+        self._failures += 1
+
+        if self._probing or self._failures >= self._threshold:
+            self._opened_at = asyncio.get_running_loop().time()
+            self._probing = False
+
+    def abandon(self, probe: bool) -> None:
+        """ the request has been given up without an outcome, e.g. cancelled """
+
+        if probe:
+            self._probing = False
+
+
+class RetryPolicy:
+    """
+    how a request is retried: exponential backoff with full jitter, at least as long as `Retry-After` asks,
+    retryable statuses, a timeout per attempt, an optional deadline over all attempts,
+    and a circuit breaker per host which is shared by all the jobs using the same policy
+    """
+
+    __slots__ = (
+        "tries",
+        "backoff_base",
+        "backoff_max",
+        "attempt_timeout",
+        "deadline",
+        "retryable_statuses",
+        "breaker_threshold",
+        "breaker_cooldown",
+        "_breakers"
+    )
+
+    def __init__(
+        self,
+        *,
+        tries: int = FETCH_FAILURE_TRIES,
+        backoff_base: float = RETRY_BACKOFF_BASE,
+        backoff_max: float = RETRY_BACKOFF_MAX,
+        attempt_timeout: Optional[float] = RETRY_ATTEMPT_TIMEOUT,
+        deadline: Optional[float] = None,
+        retryable_statuses: Iterable[int] = RETRYABLE_STATUSES,
+        breaker_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        breaker_cooldown: float = BREAKER_COOLDOWN
+    ) -> None:
+        if tries <= 0:
+            raise ValueError("`tries` must be positive")
+
+        self.tries = tries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.retryable_statuses = frozenset(retryable_statuses)
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self._breakers = {}
+
+    def is_retryable(self, status: int) -> bool:
+        return status in self.retryable_statuses
+
+    def backoff(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        """ seconds to wait before the `attempt`th retry """
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+        if headers and (asked := retry_after(headers)) is not None:
+            delay = max(delay, asked)
+
+        return delay
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+
+        if (breaker := self._breakers.get(host)) is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+
+        return breaker
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """ seconds to wait given by `Retry-After`, in either delta-seconds or HTTP-date form """
+
+    if not (value := headers.get("Retry-After")):
+        return None
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.)
+    except (TypeError, ValueError):
+        return None
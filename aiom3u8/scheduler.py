@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from typing import (
+    Optional,
+    Sequence,
+    Iterable,
+    Mapping,
+    List
+)
+
+from .core import Core
+from .session import _new_session
+from .retry import RetryPolicy
+from .observer import Observer
+from .ratelimit import TokenBucket
+from .cache import SegmentCache
+from .selection import VariantPolicy
+from .params_def import (
+    SCHEDULER_MAX_IN_FLIGHT,
+    CONNECTOR_LIMIT_PER_HOST,
+    DNS_CACHE_TTL,
+    KEEPALIVE_TIMEOUT
+)
+
+
+class JobResult:
+    __slots__ = (
+        "m3u8",
+        "video_path",
+        "video_name",
+        "error",
+        "elapsed"
+    )
+
+    def __init__(self, m3u8: str, video_path: str, video_name: str) -> None:
+        self.m3u8 = m3u8
+        self.video_path = video_path
+        self.video_name = video_name
+        self.error = None
+        self.elapsed = 0.
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class _FairLimiter:
+    """
+    limit the number of in-flight requests over all jobs
+    a free slot is handed over to the waiting jobs in turn, so that a job with many workers can not starve the others
+    """
+
+    __slots__ = (
+        "_free",
+        "_waiters"
+    )
+
+    def __init__(self, limit: int) -> None:
+        self._free = limit
+        self._waiters = OrderedDict()
+
+    async def acquire(self, job) -> None:
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job, deque()).append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot has been handed over already
+                self.release()
+            else:
+                self._discard(job, waiter)
+
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            job, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+
+            if waiters:
+                # the job queues up again behind the others
+                self._waiters.move_to_end(job)
+            else:
+                del self._waiters[job]
+
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self._free += 1
+
+    def _discard(self, job, waiter) -> None:
+        if (waiters := self._waiters.get(job)) and waiter in waiters:
+            waiters.remove(waiter)
+
+            if not waiters:
+                del self._waiters[job]
+
+
+class Scheduler:
+    """
+    download many videos at once on one shared session,
+    slice requests of all jobs are interleaved under a global in-flight limit and per-host caps
+    """
+
+    __slots__ = (
+        "_max_in_flight",
+        "_max_in_flight_per_host",
+        "_dns_cache_ttl",
+        "_keepalive_timeout",
+        "_retry_policy",
+        "_executor",
+        "_observers",
+        "_bandwidth",
+        "_cache",
+        "_variant_policy",
+        "_limiter",
+        "_host_limiters"
+    )
+
+    def __init__(
+        self,
+        *,
+        max_in_flight: Optional[int] = SCHEDULER_MAX_IN_FLIGHT,
+        max_in_flight_per_host: Optional[int] = CONNECTOR_LIMIT_PER_HOST,
+        dns_cache_ttl: Optional[int] = DNS_CACHE_TTL,
+        keepalive_timeout: Optional[float] = KEEPALIVE_TIMEOUT,
+        retry_policy: Optional[RetryPolicy] = None,
+        executor: Optional[Executor] = None,
+        observers: Optional[Sequence[Observer]] = None,
+        bandwidth_limit: Optional[float] = None,
+        cache: Optional[SegmentCache] = None,
+        variant_policy: Optional[VariantPolicy] = None
+    ) -> None:
+        if max_in_flight <= 0:
+            raise ValueError("`max_in_flight` must be positive")
+
+        self._max_in_flight = max_in_flight
+        self._max_in_flight_per_host = max_in_flight_per_host if max_in_flight_per_host > 0 else 0
+        self._dns_cache_ttl = dns_cache_ttl
+        self._keepalive_timeout = keepalive_timeout
+        # one policy for all jobs, so that they see the same circuit breakers of a failing origin
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._executor = executor
+        self._observers = observers
+        # bytes per second over all jobs, a job may have a limit of its own as well
+        self._bandwidth = TokenBucket(bandwidth_limit)
+        # jobs sharing segments, e.g. intros or ads, fetch them once
+        self._cache = cache
+        # jobs of master playlists pick their variant by this policy, the highest bandwidth by default
+        self._variant_policy = variant_policy
+
+        self._limiter = None
+        self._host_limiters = {}
+
+    @property
+    def bandwidth_limit(self) -> Optional[float]:
+        """ bytes per second, `None` for no limit; a new value takes effect on the running jobs as well """
+
+        return self._bandwidth.rate
+
+    @bandwidth_limit.setter
+    def bandwidth_limit(self, rate: Optional[float]) -> None:
+        self._bandwidth.rate = rate
+
+    @asynccontextmanager
+    async def slot(self, job, url: str):
+        """ hold one of the in-flight slots while requesting `url` on behalf of `job` """
+
+        host_limiter = None
+        if self._max_in_flight_per_host:
+            host = urlsplit(url).netloc
+            if (host_limiter := self._host_limiters.get(host)) is None:
+                host_limiter = self._host_limiters[host] = _FairLimiter(self._max_in_flight_per_host)
+
+            await host_limiter.acquire(job)
+
+        try:
+            await self._limiter.acquire(job)
+
+            try:
+                yield
+            finally:
+                self._limiter.release()
+        finally:
+            if host_limiter:
+                host_limiter.release()
+
+    async def run(self, jobs: Iterable[Mapping]) -> List[JobResult]:
+        """
+        every job is a mapping of the arguments of `aiom3u8.download`, e.g.
+        {"m3u8": ..., "video_path": ..., "video_name": ..., "headers": ...}
+        """
+
+        self._limiter = _FairLimiter(self._max_in_flight)
+        self._host_limiters = {}
+
+        session = _new_session(self._max_in_flight, self._max_in_flight_per_host,
+                               self._dns_cache_ttl, self._keepalive_timeout)
+        # decryption and disk writes of all jobs share one pool
+        executor = self._executor or ThreadPoolExecutor(thread_name_prefix="aiom3u8")
+
+        try:
+            return list(await asyncio.gather(*(self._run_job(session, executor, dict(job)) for job in jobs)))
+        finally:
+            await session.close()
+
+            if executor is not self._executor:
+                executor.shutdown(wait=False)
+
+    async def _run_job(self, session, executor, job: dict) -> JobResult:
+        m3u8, video_path, video_name = job.pop("m3u8"), job.pop("video_path"), job.pop("video_name")
+        result = JobResult(m3u8, video_path, video_name)
+
+        # jobs run unattended side by side
+        job.setdefault("auto_highest_bandwidth", True)
+        job.setdefault("progress_bar_display", False)
+        job.setdefault("retry_policy", self._retry_policy)
+        job.setdefault("executor", executor)
+        job.setdefault("observers", self._observers)
+        job.setdefault("bandwidth_limiter", self._bandwidth)
+        job.setdefault("cache", self._cache)
+        job.setdefault("variant_policy", self._variant_policy)
+
+        start = time.perf_counter()
+        try:
+            await Core(m3u8, video_path, video_name, session=session, scheduler=self, **job).download()
+        except Exception as e:
+            result.error = e
+
+        result.elapsed = time.perf_counter() - start
+
+        return result
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from abc import ABC, abstractmethod
+from typing import (
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional
+)
+
+from .parse import Variant
+
+
+class VariantProbe:
+    """ what a few slices of a variant have shown, see `FastestToComplete` """
+
+    __slots__ = (
+        "variant",
+        "segments",
+        "sample_segments",
+        "sample_size",
+        "elapsed"
+    )
+
+    def __init__(self, variant: Variant, segments: int, sample_segments: int, sample_size: int, elapsed: float) -> None:
+        self.variant = variant
+        # slices in the media playlist of the variant
+        self.segments = segments
+        self.sample_segments = sample_segments
+        self.sample_size = sample_size
+        self.elapsed = elapsed
+
+    @property
+    def estimated_size(self) -> float:
+        """ bytes of the whole variant, going by the sampled slices """
+
+        return self.sample_size / self.sample_segments * self.segments
+
+
+Probe = Callable[[Variant], Awaitable[Optional[VariantProbe]]]
+
+
+class VariantPolicy(ABC):
+    """
+    picks a variant of a master playlist without asking anyone, for `Core(variant_policy=...)`
+    `probe` fetches a few slices of a variant through the session of the job, `None` if the variant is not available
+    """
+
+    __slots__ = ()
+
+    @abstractmethod
+    async def select(self, variants: list, probe: Probe) -> Variant:
+        pass
+
+
+class HighestBandwidth(VariantPolicy):
+    """ the highest `BANDWIDTH` not over `max_bandwidth`, the lowest one if all of them are """
+
+    __slots__ = (
+        "max_bandwidth",
+    )
+
+    def __init__(self, max_bandwidth: Optional[int] = None) -> None:
+        self.max_bandwidth = max_bandwidth
+
+    async def select(self, variants: list, probe: Probe) -> Variant:
+        allowed = [variant for variant in variants
+                   if self.max_bandwidth is None or variant.bandwidth <= self.max_bandwidth]
+
+        if not allowed:
+            return min(variants, key=lambda variant: variant.bandwidth)
+
+        return max(allowed, key=lambda variant: variant.bandwidth)
+
+
+class TargetResolution(VariantPolicy):
+    """
+    the variant of the height closest to `height` without going over it, a higher one only if there is no other,
+    of the given codecs (prefixes of `CODECS` like "avc1" or "hvc1") if any, the higher `BANDWIDTH` on a tie
+    """
+
+    __slots__ = (
+        "height",
+        "codecs"
+    )
+
+    def __init__(self, height: int, codecs: Optional[Iterable[str]] = None) -> None:
+        self.height = height
+        self.codecs = tuple(codecs or ())
+
+    async def select(self, variants: list, probe: Probe) -> Variant:
+        if self.codecs:
+            variants = [variant for variant in variants if variant.codecs and any(
+                codec.strip().startswith(self.codecs) for codec in variant.codecs.split(','))]
+
+            if not variants:
+                raise ValueError(f"no variant is of the codecs {', '.join(self.codecs)}")
+
+        if not (sized := [variant for variant in variants if variant.resolution]):
+            return max(variants, key=lambda variant: variant.bandwidth)
+
+        if lower := [variant for variant in sized if variant.resolution[1] <= self.height]:
+            return max(lower, key=lambda variant: (variant.resolution[1], variant.bandwidth))
+
+        return min(sized, key=lambda variant: (variant.resolution[1], -variant.bandwidth))
+
+
+class FastestToComplete(VariantPolicy):
+    """
+    probe a few slices of every variant at once, and pick the highest `BANDWIDTH` one that would be downloaded
+    within `deadline` seconds at the throughput the probes got, the quickest one if none would
+    the throughput is that of a handful of requests, so the estimate errs on the slow side
+    """
+
+    __slots__ = (
+        "deadline",
+    )
+
+    def __init__(self, deadline: float) -> None:
+        if deadline <= 0:
+            raise ValueError("`deadline` must be positive")
+
+        self.deadline = deadline
+
+    async def select(self, variants: list, probe: Probe) -> Variant:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        probes = [probe_ for probe_ in await asyncio.gather(*(probe(variant) for variant in variants)) if probe_]
+        if not probes:
+            raise Exception("none of the variants is available")
+
+        elapsed = loop.time() - start
+        throughput = sum(probe_.sample_size for probe_ in probes) / elapsed if elapsed > 0 else float("inf")
+
+        in_time = [probe_ for probe_ in probes if probe_.estimated_size / throughput <= self.deadline]
+        if not in_time:
+            return min(probes, key=lambda probe_: probe_.estimated_size).variant
+
+        return max(in_time, key=lambda probe_: probe_.variant.bandwidth).variant
@@ -1,18 +1,97 @@
+import asyncio
+
+from asyncio.exceptions import TimeoutError
 from aiohttp.client import (
     ClientSession,
+    ClientResponse,
+    ClientTimeout,
     ClientError
 )
+from aiohttp.connector import TCPConnector
+from typing import (
+    Optional,
+    Callable
+)
+
+from .retry import RetryPolicy
+
+
+def _new_session(
+    limit: int, limit_per_host: int, dns_cache_ttl: int, keepalive_timeout: float
+) -> ClientSession:
+    """ build up a session whose connection pool is shared by all requests of a job """
+
+    connector = TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_cache_ttl,
+        keepalive_timeout=keepalive_timeout
+    )
+
+    return ClientSession(connector=connector)
+
+
+async def _get(
+    session: ClientSession,
+    url: str,
+    policy: RetryPolicy,
+    on_failure: Optional[Callable[[Optional[ClientResponse]], None]] = None,
+    defer_success: bool = False,
+    **kwargs
+) -> Optional[ClientResponse]:
+    """
+    request `url` under the retry policy, the response returned is either successful or not worth retrying,
+    a response with a retryable status is returned only when retries are used up, `None` if no response came at all
+    `on_failure` is told about every failed attempt, with its response if there is one
+    with `defer_success`, the caller tells the breaker of the host whether the body has been read in full
+    """
 
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.deadline if policy.deadline else None
+    breaker = policy.breaker(url)
 
-async def _get(session: ClientSession, url: str, retries: int, **kwargs):
-    index = 0
     resp = None
 
-    while index < retries:
+    for attempt in range(policy.tries):
+        if attempt:
+            delay = policy.backoff(attempt, resp.headers if resp else None)
+            if deadline is not None and loop.time() + delay >= deadline:
+                break
+
+            if resp:
+                resp.release()
+                resp = None
+
+            await asyncio.sleep(delay)
+
+        probe = await breaker.acquire()
+
+        # a stalled body read fails the same way as a stalled connection, and the deadline covers the body as well
+        timeout = ClientTimeout(total=deadline - loop.time() if deadline is not None else None,
+                                sock_connect=policy.attempt_timeout, sock_read=policy.attempt_timeout)
+
         try:
-            resp = await session.get(url, **kwargs)
-            break
-        except ClientError:
-            index += 1
+            resp = await session.get(url, timeout=timeout, **kwargs)
+        except (ClientError, TimeoutError):
+            breaker.failure()
+            if on_failure:
+                on_failure(None)
+
+            continue
+        except BaseException:
+            breaker.abandon(probe)
+            raise
+
+        if not policy.is_retryable(resp.status):
+            # fatal statuses are not retried either, the origin itself is up,
+            # while an origin which resets midway would keep the breaker closed if it was told so now
+            if probe or not defer_success:
+                breaker.success()
+            return resp
+
+        breaker.failure()
+        if on_failure:
+            on_failure(resp)
 
     return resp
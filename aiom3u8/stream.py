@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os
+import asyncio
+import inspect
+
+from typing import (
+    AsyncIterator,
+    Callable,
+    Optional
+)
+
+from .parse import Map
+
+
+class SegmentStream:
+    """
+    stands in for `Merge` when the slices are consumed as a stream instead of being written to disk,
+    slices are kept in memory until they are consumed in order, at most `read_ahead` slices past the consumer
+    """
+
+    __slots__ = (
+        "_init_map_uri",
+        "_read_ahead",
+        "_next_index",
+        "_fetched",
+        "_done",
+        "_arrived",
+        "_consumed",
+        "_finished",
+        "_error"
+    )
+
+    def __init__(self, read_ahead: int) -> None:
+        if read_ahead <= 0:
+            raise ValueError("`read_ahead` must be positive")
+
+        self._init_map_uri = None
+        self._read_ahead = read_ahead
+        self._next_index = 0
+        self._fetched = {}
+        self._done = {}
+        self._arrived = asyncio.Event()
+        self._consumed = asyncio.Event()
+        self._finished = False
+        self._error = None
+
+    def setup(self, init_map: Optional[Map]) -> None:
+        """ the init section is streamed ahead of the media slices """
+
+        if init_map:
+            self._init_map_uri = init_map.uri
+
+    @property
+    def pre_uri(self) -> Optional[str]:
+        return self._init_map_uri
+
+    @property
+    def read_ahead(self) -> int:
+        return self._read_ahead
+
+    def extend(self, slices_num: int) -> None:
+        pass
+
+    def slice_path(self, index: int) -> None:
+        """ slices of a stream have no local path, they are fetched into memory """
+
+        return None
+
+    def prepare(self, merged: int, on_merged: Callable[[int], None]) -> None:
+        self._next_index = merged
+
+    def keep(self, index: int, data: bytes) -> None:
+        self._fetched[index] = data
+
+    def slice_done(self, index: int) -> None:
+        self._done[index] = self._fetched.pop(index)
+        self._arrived.set()
+
+    async def window(self, index: int) -> None:
+        """ wait until the slice is within the read-ahead of the consumer """
+
+        while index >= self._next_index + self._read_ahead:
+            self._consumed.clear()
+            await self._consumed.wait()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self._finished = True
+        self._error = error
+        self._arrived.set()
+
+    async def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        while self._next_index not in self._done:
+            if self._finished:
+                if self._error:
+                    raise self._error
+
+                raise StopAsyncIteration
+
+            self._arrived.clear()
+            await self._arrived.wait()
+
+        data = self._done.pop(self._next_index)
+        self._next_index += 1
+        self._consumed.set()
+
+        return data
+
+
+async def write_to(segments: AsyncIterator[bytes], sink) -> int:
+    """
+    write the segments to `sink` in order, return the number of bytes written
+    `sink` is a file descriptor, an `asyncio.StreamWriter`, or any object with a `write` method,
+    which is awaited if it is a coroutine function, or run in the default executor otherwise
+    """
+
+    loop = asyncio.get_running_loop()
+    written = 0
+
+    async for data in segments:
+        if isinstance(sink, int):
+            await loop.run_in_executor(None, _write_fd, sink, data)
+        elif isinstance(sink, asyncio.StreamWriter):
+            sink.write(data)
+            await sink.drain()
+        elif inspect.iscoroutinefunction(sink.write):
+            await sink.write(data)
+        else:
+            await loop.run_in_executor(None, sink.write, data)
+
+        written += len(data)
+
+    return written
+
+
+def _write_fd(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+
+    while view:
+        view = view[os.write(fd, view):]
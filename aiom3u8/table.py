@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from array import array
+from urllib.parse import urljoin
+from typing import (
+    Optional,
+    Tuple
+)
+
+from Crypto.Cipher import AES
+
+# no byte range, or no key, in the arrays below
+_NONE = -1
+
+
+class SegmentTable:
+    """
+    the slices of a job by index, kept compact for playlists of hundreds of thousands of slices:
+    an absolute url is a prefix shared with the other slices plus a suffix packed into one buffer,
+    byte ranges, keys, sequence numbers and retry counters are arrays of numbers
+    """
+
+    __slots__ = (
+        "_base_url",
+        "_prefixes",
+        "_prefix_ids",
+        "_url_prefixes",
+        "_suffixes",
+        "_suffix_ends",
+        "_range_lengths",
+        "_range_offsets",
+        "_keys",
+        "_key_ids",
+        "_slice_keys",
+        "_sequences",
+        "_retries"
+    )
+
+    def __init__(self, base_url: str) -> None:
+        # relative uris are resolved against the media playlist
+        self._base_url = base_url
+
+        self._prefixes = []
+        self._prefix_ids = {}
+        self._url_prefixes = array('I')
+        self._suffixes = bytearray()
+        self._suffix_ends = array('Q')
+
+        self._range_lengths = array('q')
+        self._range_offsets = array('q')
+
+        # (key url, iv given by `EXT-X-KEY` or `None`), every distinct one once
+        self._keys = []
+        self._key_ids = {}
+        self._slice_keys = array('i')
+        self._sequences = array('Q')
+
+        self._retries = array('I')
+
+    def __len__(self) -> int:
+        return len(self._url_prefixes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.url(index)
+
+    def append(
+        self, uri: str, byterange: Optional[Tuple[int, int]] = None, key_url: Optional[str] = None,
+        iv: Optional[bytes] = None, sequence: int = 0
+    ) -> None:
+        """ a slice at `uri`, encrypted by the key at `key_url`, with the iv derived from `sequence` unless given """
+
+        url = urljoin(self._base_url, uri)
+        # everything up to the last slash is shared by the slices of a directory
+        prefix, suffix = url[: url.rfind('/') + 1], url[url.rfind('/') + 1:]
+
+        if (prefix_id := self._prefix_ids.get(prefix)) is None:
+            prefix_id = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+
+        self._url_prefixes.append(prefix_id)
+        self._suffixes += suffix.encode()
+        self._suffix_ends.append(len(self._suffixes))
+
+        length, offset = byterange or (_NONE, _NONE)
+        self._range_lengths.append(length)
+        self._range_offsets.append(offset)
+
+        if key_url is None:
+            key_id = _NONE
+        elif (key_id := self._key_ids.get((key_url, iv))) is None:
+            key_id = self._key_ids[(key_url, iv)] = len(self._keys)
+            self._keys.append((key_url, iv))
+
+        self._slice_keys.append(key_id)
+        self._sequences.append(sequence)
+        self._retries.append(0)
+
+    def url(self, index: int) -> str:
+        start = self._suffix_ends[index - 1] if index else 0
+
+        return self._prefixes[self._url_prefixes[index]] + self._suffixes[start: self._suffix_ends[index]].decode()
+
+    def byterange(self, index: int) -> Optional[Tuple[int, int]]:
+        """ (length, offset) """
+
+        if self._range_lengths[index] == _NONE:
+            return None
+
+        return self._range_lengths[index], self._range_offsets[index]
+
+    def key(self, index: int) -> Optional[Tuple[str, bytes]]:
+        """ (key url, iv) of an encrypted slice """
+
+        if (key_id := self._slice_keys[index]) == _NONE:
+            return None
+
+        key_url, iv = self._keys[key_id]
+
+        return key_url, iv or self._sequences[index].to_bytes(AES.block_size, "big")
+
+    def retry(self, index: int) -> int:
+        """ count one more retry of the slice, return how many times it has been retried """
+
+        self._retries[index] += 1
+
+        return self._retries[index]
+
+    @property
+    def retries(self) -> int:
+        return sum(self._retries)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from urllib.parse import urlsplit
+from typing import (
+    Optional,
+    Tuple
+)
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+# boxes an fMP4 init section or media segment may start with
+MP4_LEADING_BOXES = (b"ftyp", b"styp", b"sidx", b"moov", b"moof", b"emsg", b"prft", b"free", b"skip", b"uuid")
+
+KIND_TS = "ts"
+KIND_MP4 = "mp4"
+# anything else, e.g. packed audio or WebVTT, is not looked into
+KIND_OTHER = "other"
+
+TS_EXTENSIONS = (".ts", ".m2ts", ".mts")
+MP4_EXTENSIONS = (".m4s", ".mp4", ".m4v", ".m4a", ".cmfv", ".cmfa", ".cmft")
+
+
+class InvalidSlice(Exception):
+    """ a slice whose body is broken, it is fetched again rather than merged """
+
+
+def expected_container(uri: str, init_map: bool) -> Optional[str]:
+    """ the container a slice at `uri` has to be of, going by the playlist, `None` if it can not be told """
+
+    path = urlsplit(uri).path.lower()
+
+    if path.endswith(TS_EXTENSIONS):
+        return KIND_TS
+
+    # an init section is only given for fMP4, but for the rare MPEG-TS one which has got a `.ts` uri as well
+    if init_map or path.endswith(MP4_EXTENSIONS):
+        return KIND_MP4
+
+    return None
+
+
+def check_container(data: bytes, state: Optional[Tuple], final: bool, expected: Optional[str] = None) -> Tuple:
+    """
+    check the decrypted bytes of a slice as they come, batch by batch, `state` is `None` for the first batch,
+    and the state returned is passed along with the next one
+    MPEG-TS is checked for the sync byte every 188 bytes, fMP4 for a sane header of every box, and both
+    for ending on a packet or box boundary; a slice of another kind than `expected`, if given, is rejected
+    as well, anything goes otherwise but markup; raises `InvalidSlice`
+    the state is a tuple of plain values, so that it can be sent to an executor process as well
+    """
+
+    kind, skip, carry = state or (None, 0, b'')
+
+    if kind is None:
+        # the kind is told by the first bytes, which may come in more than one batch
+        data = carry + data
+        if len(data) <= TS_PACKET_SIZE and not final:
+            return None, 0, data
+
+        if not data:
+            raise InvalidSlice("slice is empty")
+
+        kind, carry = _detect(data), b''
+
+        if expected and kind != expected:
+            raise InvalidSlice(f"slice is not {expected}")
+
+    if kind == KIND_TS:
+        # `skip` bytes to the next packet
+        if skip < len(data) and data[skip::TS_PACKET_SIZE].strip(bytes((TS_SYNC_BYTE,))):
+            raise InvalidSlice("MPEG-TS sync byte is missing")
+
+        skip = (skip - len(data)) % TS_PACKET_SIZE
+    elif kind == KIND_MP4 and skip is not None:
+        # `skip` bytes to the next box, `None` once a box runs to the end of the slice
+        if skip >= len(data):
+            skip -= len(data)
+        else:
+            skip, carry = _walk_boxes(carry + data[skip:])
+
+    if final and (skip or carry) and kind != KIND_OTHER:
+        raise InvalidSlice(f"{kind} slice is truncated")
+
+    return kind, skip, carry
+
+
+def _detect(data: bytes) -> str:
+    if data[: 1] == bytes((TS_SYNC_BYTE,)) and data[TS_PACKET_SIZE: TS_PACKET_SIZE + 1] in (b'', bytes((TS_SYNC_BYTE,))):
+        return KIND_TS
+
+    if data[4: 8] in MP4_LEADING_BOXES:
+        return KIND_MP4
+
+    if data[: 64].lstrip()[: 5].lower() in (b"<!doc", b"<html", b"<?xml"):
+        # an error page served with a success status
+        raise InvalidSlice("slice is a markup document")
+
+    return KIND_OTHER
+
+
+def _walk_boxes(data: bytes) -> Tuple[Optional[int], bytes]:
+    """
+    walk the box headers in `data`, which starts at a box boundary,
+    return the bytes to the next box past `data`, and the part of a header cut off at its end
+    """
+
+    position = 0
+
+    while position < len(data):
+        header = data[position: position + 16]
+
+        if len(header) < 8 or (header[: 4] == b"\0\0\0\1" and len(header) < 16):
+            # the rest of the header comes with the next batch
+            return 0, header
+
+        size = int.from_bytes(header[: 4], "big")
+        box_type = header[4: 8]
+
+        if size == 1:
+            size = int.from_bytes(header[8: 16], "big")
+        elif size == 0:
+            # the box runs to the end of the slice
+            return None, b''
+
+        if size < 8 or not all(0x20 <= byte <= 0x7e for byte in box_type):
+            raise InvalidSlice("fMP4 box header is broken")
+
+        position += size
+
+    return position - len(data), b''
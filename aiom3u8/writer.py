@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import zlib
+import asyncio
+
+from concurrent.futures import Executor
+from typing import (
+    Optional,
+    Tuple
+)
+
+from .decrypt import split_batch, decrypt_batch
+from .validate import check_container
+from .params_def import OFFLOAD_BUFFER_SIZE
+
+
+class SliceWriter:
+    """
+    decrypt and write a slice in an executor, off the event loop
+    only one batch of a slice is in the executor at a time, the chunks read meanwhile are batched up,
+    and reading stops once `OFFLOAD_BUFFER_SIZE` bytes are waiting
+    without a path the slice is kept in memory, see `data`
+    with `validate`, the decrypted slice is checked on the way to be of the `container` kind if given,
+    see `check_container`
+    """
+
+    __slots__ = (
+        "_path",
+        "_executor",
+        "_key",
+        "_iv",
+        "_pending",
+        "_job",
+        "_started",
+        "_size",
+        "_checksum",
+        "_chunks",
+        "_validate",
+        "_container",
+        "_validation"
+    )
+
+    def __init__(
+        self, path: Optional[str], executor: Executor, key: Optional[bytes] = None, iv: Optional[bytes] = None,
+        validate: bool = False, container: Optional[str] = None
+    ) -> None:
+        self._path = path
+        self._executor = executor
+        self._key = key
+        self._iv = iv
+        self._pending = bytearray()
+        self._job = None
+        self._started = False
+        self._size = 0
+        self._checksum = 0
+        self._chunks = []
+        self._validate = validate
+        self._container = container
+        self._validation = None
+
+    async def write(self, chunk: bytes) -> None:
+        self._pending += chunk
+
+        if self._job:
+            if not self._job.done() and len(self._pending) < OFFLOAD_BUFFER_SIZE:
+                # keep reading while the previous batch is being processed
+                return
+
+            await self._wait()
+
+        self._submit(False)
+
+    @property
+    def container(self) -> Optional[str]:
+        """ the kind of the slice as validated, `None` without validation """
+
+        return self._validation[0] if self._validation else None
+
+    @property
+    def data(self) -> bytes:
+        """ the whole slice, when it is kept in memory """
+
+        return b''.join(self._chunks)
+
+    async def close(self) -> Tuple[int, int]:
+        """ flush the rest of the slice, return the size and the crc32 of what has been written """
+
+        await self._wait()
+        self._submit(True)
+        await self._wait()
+
+        return self._size, self._checksum
+
+    async def discard(self) -> None:
+        """ let the batch in the executor land before the slice file is written again """
+
+        try:
+            await self._wait()
+        except Exception:
+            pass
+
+    def _submit(self, final: bool) -> None:
+        if self._key:
+            batch, next_iv = split_batch(self._pending, final)
+        else:
+            batch, next_iv = bytes(self._pending), None
+            self._pending.clear()
+
+        if not batch and self._started and not final:
+            return
+
+        self._job = asyncio.get_running_loop().run_in_executor(
+            self._executor, _write_batch,
+            self._path, not self._started, self._key, self._iv, batch, final, self._checksum,
+            self._validate, self._container, self._validation
+        )
+        self._started = True
+
+        if next_iv:
+            self._iv = next_iv
+
+    async def _wait(self) -> None:
+        if not self._job:
+            return
+
+        # shielded, so that a cancelled slice can still wait for the batch in the executor in `discard`
+        size, self._checksum, chunk, self._validation = await asyncio.shield(self._job)
+        self._job = None
+        self._size += size
+
+        if chunk is not None:
+            self._chunks.append(chunk)
+
+
+def _write_batch(
+    path: Optional[str], truncate: bool, key: Optional[bytes], iv: Optional[bytes], batch: bytes, final: bool,
+    checksum: int, validate: bool, container: Optional[str], validation: Optional[tuple]
+) -> Tuple[int, int, Optional[bytes], Optional[tuple]]:
+    """ runs in the executor, so it is a plain function of plain arguments which can be sent to a process as well """
+
+    if key and batch:
+        batch = decrypt_batch(key, iv, batch, final)
+
+    if validate:
+        validation = check_container(batch, validation, final, container)
+
+    if path is None:
+        return len(batch), zlib.crc32(batch, checksum), batch, validation
+
+    with open(path, 'wb' if truncate else 'ab') as slice_file:
+        slice_file.write(batch)
+
+    return len(batch), zlib.crc32(batch, checksum), None, validation
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark of `download_coro` against a local HLS origin (see origin.py), one JSON report for all the kinds
+
+    $ python benchmarks/bench_download.py --kind all --segments 200 --latency 0.02 --error-rate 0.01 > before.json
+
+every kind runs in a process of its own, so that the peak RSS is of that run alone
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import resource
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import aiom3u8
+from aiom3u8.merge import Merge
+
+from origin import KINDS, add_arguments, expected_output
+
+LAG_INTERVAL = .01
+
+
+async def _watch_loop_lag(lags: list) -> None:
+    """ how late the loop wakes up a task which asked to sleep for `LAG_INTERVAL` """
+
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(loop.time() - start - LAG_INTERVAL)
+
+
+def _timed_merge_start(timings: list):
+    merge_start = Merge.start
+
+    def start(self):
+        begin = time.perf_counter()
+        try:
+            return merge_start(self)
+        finally:
+            timings.append(time.perf_counter() - begin)
+
+    return start
+
+
+async def _run(args) -> dict:
+    out_dir = tempfile.mkdtemp(prefix="aiom3u8-bench-")
+    lags = []
+    merge_timings = []
+    Merge.start = _timed_merge_start(merge_timings)
+
+    kwargs = dict(progress_bar_display=False, remux=False, resume=False, video_name_extension=".ts")
+    if args.concurrency > 0:
+        kwargs["async_tasks_maintain"] = args.concurrency
+
+    watcher = asyncio.create_task(_watch_loop_lag(lags))
+    start = time.perf_counter()
+    error = None
+
+    try:
+        await aiom3u8.download_coro(f"{args.origin}/{args.kind}/index.m3u8", out_dir, "bench", **kwargs)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        elapsed = time.perf_counter() - start
+        watcher.cancel()
+
+    # taken before the verification below loads whole videos into memory
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    video_path = os.path.join(out_dir, "bench.ts")
+    size = os.path.getsize(video_path) if os.path.isfile(video_path) else 0
+    verified = (error is None
+                and open(video_path, "rb").read() == expected_output(args.kind, args.segments, args.segment_size))
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    merge_s = sum(merge_timings)
+    lags.sort()
+
+    return {
+        "kind": args.kind,
+        "error": error,
+        "verified": verified,
+        "segments": args.segments,
+        "bytes": size,
+        "elapsed_s": elapsed,
+        "download_s": elapsed - merge_s,
+        "merge_s": merge_s,
+        "segments_per_s": args.segments / (elapsed - merge_s) if error is None else 0.,
+        "mb_per_s": size / 1e6 / (elapsed - merge_s) if error is None else 0.,
+        # kilobytes on Linux, bytes on macOS
+        "peak_rss_mb": peak_rss / (1e6 if sys.platform == "darwin" else 1e3),
+        "loop_lag_ms": {
+            "max": lags[-1] * 1e3 if lags else 0.,
+            "p99": lags[int(len(lags) * .99)] * 1e3 if lags else 0.,
+            "mean": sum(lags) / len(lags) * 1e3 if lags else 0.
+        }
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 10.) -> None:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), .5).close()
+            return
+        except OSError:
+            time.sleep(.05)
+
+    raise RuntimeError("origin did not come up")
+
+
+def _origin_arguments(args) -> list:
+    return ["--segments", str(args.segments), "--segment-size", str(args.segment_size),
+            "--latency", str(args.latency), "--bandwidth", str(args.bandwidth),
+            "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kind", choices=KINDS + ("all",), default="all")
+    parser.add_argument("--concurrency", type=int, default=0, help="`async_tasks_maintain`, 0 for unlimited")
+    parser.add_argument("--origin", help="url of a running origin, one is started otherwise")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.origin and args.kind != "all":
+        print(json.dumps(asyncio.run(_run(args))))
+        return
+
+    origin = None
+    if not args.origin:
+        port = _free_port()
+        origin = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "origin.py"),
+                                   "--port", str(port), *_origin_arguments(args)], stderr=subprocess.DEVNULL)
+        _wait_for_port(port)
+        args.origin = f"http://127.0.0.1:{port}"
+
+    try:
+        results = []
+        for kind in (KINDS if args.kind == "all" else (args.kind,)):
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--kind", kind, "--origin", args.origin,
+                                   "--concurrency", str(args.concurrency), *_origin_arguments(args)],
+                                  stdout=subprocess.PIPE, check=True)
+            results.append(json.loads(proc.stdout.decode().strip().splitlines()[-1]))
+    finally:
+        if origin:
+            origin.terminate()
+            origin.wait()
+
+    print(json.dumps({
+        "benchmark": "download",
+        "version": aiom3u8.__version__,
+        "parameters": {
+            "segments": args.segments,
+            "segment_size": args.segment_size,
+            "latency": args.latency,
+            "bandwidth": args.bandwidth,
+            "error_rate": args.error_rate,
+            "concurrency": args.concurrency
+        },
+        "results": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
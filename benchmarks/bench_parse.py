@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark of the playlist tokenizer on large (DVR-like) media playlists
+
+    $ python benchmarks/bench_parse.py --segments 100000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from aiom3u8.parse import Parse
+
+
+def synthetic_playlist(segments: int, key_rotation: int = 1000) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:4", "#EXT-X-TARGETDURATION:6", "#EXT-X-MEDIA-SEQUENCE:0"]
+
+    for index in range(segments):
+        if not index % key_rotation:
+            lines.append(f'#EXT-X-KEY:METHOD=AES-128,URI="https://cdn.example.com/keys/{index}.key",IV=0x{index:032x}')
+
+        lines.append("#EXTINF:6.006,")
+        lines.append(f"https://cdn.example.com/vod/stream/1080p/segment_{index:08d}.ts?token=0123456789abcdef")
+
+    lines.append("#EXT-X-ENDLIST")
+
+    return "\r\n".join(lines) + "\r\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    content = synthetic_playlist(args.segments)
+    timings = []
+
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        playlist = Parse.playlist(content)
+        timings.append(time.perf_counter() - start)
+
+        assert len(playlist.segments) == args.segments
+
+    print(json.dumps({
+        "benchmark": "parse",
+        "segments": args.segments,
+        "playlist_bytes": len(content),
+        "best_s": min(timings),
+        "mean_s": sum(timings) / len(timings),
+        "segments_per_s": args.segments / min(timings)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+local stand-in of an HLS origin serving synthetic streams, for the benchmarks
+
+    $ python benchmarks/origin.py --port 8700 --segments 200 --latency 0.05 --bandwidth 20e6 --error-rate 0.01
+
+    /master.m3u8                    one variant of each kind
+    /{kind}/index.m3u8              kind is one of `plain`, `aes`, `fmp4`, `byterange`
+    /aes/key                        AES-128 key, the IV of a segment is its media sequence number
+    /fmp4/init.mp4                  `EXT-X-MAP` init section
+    /byterange/stream.ts            every segment is a byte range of this single file
+"""
+import sys
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+KINDS = ("plain", "aes", "fmp4", "byterange")
+KEY = bytes(range(16))
+TS_PACKET_SIZE = 188
+SEGMENT_DURATION = 4.
+WRITE_CHUNK_SIZE = 64 * 1024
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return (len(payload) + 8).to_bytes(4, "big") + box_type + payload
+
+
+def segment_payload(index: int, size: int) -> bytes:
+    """ clear bytes of a MPEG-TS segment, made of sync-byte led packets """
+
+    packets = max(size // TS_PACKET_SIZE, 1)
+    filler = bytes([index % 256]) * (TS_PACKET_SIZE - 1)
+
+    return (b'\x47' + filler) * packets
+
+
+def fmp4_init() -> bytes:
+    return _box(b"ftyp", b"isom\0\0\2\0isomiso6mp41") + _box(b"moov", _box(b"mvhd", bytes(100)))
+
+
+def fmp4_fragment(index: int, size: int) -> bytes:
+    moof = _box(b"moof", _box(b"mfhd", bytes(4) + (index + 1).to_bytes(4, "big")))
+    return moof + _box(b"mdat", bytes([index % 256]) * max(size - len(moof) - 8, 0))
+
+
+def expected_output(kind: str, segments: int, segment_size: int) -> bytes:
+    """ what a download of `kind` is expected to end up with, before any remuxing """
+
+    if kind == "fmp4":
+        return fmp4_init() + b"".join(fmp4_fragment(index, segment_size) for index in range(segments))
+
+    return b"".join(segment_payload(index, segment_size) for index in range(segments))
+
+
+class Origin:
+    __slots__ = (
+        "segments",
+        "segment_size",
+        "latency",
+        "bandwidth",
+        "error_rate",
+        "requests",
+        "errors",
+        "_random",
+        "_bodies",
+        "_stream"
+    )
+
+    def __init__(
+        self,
+        segments: int = 100,
+        segment_size: int = 188 * 5000,
+        latency: float = 0.,
+        bandwidth: float = 0.,
+        error_rate: float = 0.,
+        seed: int = 0
+    ) -> None:
+        self.segments = segments
+        self.segment_size = segment_size
+        # seconds before the response headers, bytes per second of every response body (0 for unlimited)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        # share of segment requests answered with 500/503
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+
+        self._random = random.Random(seed)
+        self._bodies = {}
+        self._stream = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/master.m3u8", self._master)
+        app.router.add_get("/aes/key", self._key)
+        app.router.add_get("/fmp4/init.mp4", self._init)
+        app.router.add_get("/byterange/stream.ts", self._byterange)
+        app.router.add_get("/{kind}/index.m3u8", self._media)
+        app.router.add_get("/{kind}/seg{index:\\d+}.{ext}", self._segment)
+
+        return app
+
+    async def _master(self, request: web.Request) -> web.Response:
+        lines = ["#EXTM3U"]
+
+        for bandwidth, kind in enumerate(KINDS, 1):
+            lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth * 1000000}", f"{kind}/index.m3u8"]
+
+        return web.Response(text="\n".join(lines) + "\n")
+
+    async def _media(self, request: web.Request) -> web.Response:
+        kind = request.match_info["kind"]
+        if kind not in KINDS:
+            raise web.HTTPNotFound()
+
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", f"#EXT-X-TARGETDURATION:{int(SEGMENT_DURATION)}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+
+        if kind == "aes":
+            lines.append('#EXT-X-KEY:METHOD=AES-128,URI="key"')
+        elif kind == "fmp4":
+            lines.append('#EXT-X-MAP:URI="init.mp4"')
+
+        for index in range(self.segments):
+            lines.append(f"#EXTINF:{SEGMENT_DURATION:.3f},")
+
+            if kind == "byterange":
+                lines.append(f"#EXT-X-BYTERANGE:{self._segment_length(index)}")
+                lines.append("stream.ts")
+            else:
+                lines.append(f"seg{index}.{'m4s' if kind == 'fmp4' else 'ts'}")
+
+        lines.append("#EXT-X-ENDLIST")
+
+        return web.Response(text="\n".join(lines) + "\n")
+
+    async def _key(self, request: web.Request) -> web.Response:
+        return web.Response(body=KEY)
+
+    async def _init(self, request: web.Request) -> web.StreamResponse:
+        return await self._send(request, fmp4_init())
+
+    async def _segment(self, request: web.Request) -> web.StreamResponse:
+        kind, index = request.match_info["kind"], int(request.match_info["index"])
+        if kind not in KINDS or index >= self.segments:
+            raise web.HTTPNotFound()
+
+        self.requests += 1
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.latency)
+            return web.Response(status=self._random.choice((500, 503)))
+
+        return await self._send(request, self._body(kind, index))
+
+    async def _byterange(self, request: web.Request) -> web.StreamResponse:
+        if self._stream is None:
+            self._stream = b"".join(segment_payload(index, self.segment_size) for index in range(self.segments))
+
+        self.requests += 1
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.latency)
+            return web.Response(status=503)
+
+        if not (http_range := request.http_range) or http_range.start is None:
+            return await self._send(request, self._stream)
+
+        stop = len(self._stream) if http_range.stop is None else min(http_range.stop, len(self._stream))
+        headers = {"Content-Range": f"bytes {http_range.start}-{stop - 1}/{len(self._stream)}"}
+
+        return await self._send(request, self._stream[http_range.start: stop], 206, headers)
+
+    def _body(self, kind: str, index: int) -> bytes:
+        if (body := self._bodies.get((kind, index))) is None:
+            if kind == "fmp4":
+                body = fmp4_fragment(index, self.segment_size)
+            elif kind == "aes":
+                body = AES.new(KEY, AES.MODE_CBC, index.to_bytes(16, "big")).encrypt(
+                    pad(segment_payload(index, self.segment_size), AES.block_size))
+            else:
+                body = segment_payload(index, self.segment_size)
+
+            self._bodies[(kind, index)] = body
+
+        return body
+
+    def _segment_length(self, index: int) -> int:
+        return len(segment_payload(index, self.segment_size))
+
+    async def _send(self, request: web.Request, body: bytes, status: int = 200, headers=None) -> web.StreamResponse:
+        await asyncio.sleep(self.latency)
+
+        if not self.bandwidth:
+            return web.Response(body=body, status=status, headers=headers)
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        for offset in range(0, len(body), WRITE_CHUNK_SIZE):
+            chunk = body[offset: offset + WRITE_CHUNK_SIZE]
+            await response.write(chunk)
+
+            # pace the body to the bandwidth of this connection
+            if (ahead := (offset + len(chunk)) / self.bandwidth - (loop.time() - start)) > 0:
+                await asyncio.sleep(ahead)
+
+        await response.write_eof()
+
+        return response
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--segments", type=int, default=100)
+    parser.add_argument("--segment-size", type=int, default=188 * 5000, help="bytes of a clear segment")
+    parser.add_argument("--latency", type=float, default=0., help="seconds before the response headers")
+    parser.add_argument("--bandwidth", type=float, default=0., help="bytes per second per connection, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0., help="share of segment requests failed with 5xx")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    origin = Origin(args.segments, args.segment_size, args.latency, args.bandwidth, args.error_rate, args.seed)
+
+    print(f"serving on http://{args.host}:{args.port}/master.m3u8", file=sys.stderr, flush=True)
+    web.run_app(origin.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()